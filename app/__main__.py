@@ -1,4 +1,6 @@
-from asyncio import create_task, run, sleep
+from argparse import SUPPRESS, ArgumentParser, Namespace
+from asyncio import FIRST_COMPLETED, Task, create_task, gather, run, wait
+from contextlib import ExitStack
 from pathlib import Path
 from sys import version_info
 
@@ -8,13 +10,16 @@ from rich.padding import Padding
 from rich.panel import Panel
 from tdmclient import ClientAsync
 
+from app.batch import run_batch
 from app.big_brain import BigBrain
-from app.config import DEBUG, PROCESS_MSG_INTERVAL, RAISE_DEPRECATION_WARNINGS
+from app.config import DEBUG, RAISE_DEPRECATION_WARNINGS
 from app.context import Context
+from app.recording import Recorder, Replay
 from app.server import Server
 from app.state import State
 from app.utils.console import *
 from app.utils.pool import Pool
+from app.utils.pump import MessagePump
 from app.utils.types import Channel, Vec2
 
 VERSION_MAJOR = 3
@@ -22,6 +27,8 @@ VERSION_MINOR = 10
 
 
 def main():
+    options = parse_args()
+
     print_banner()
 
     if not check_version() or not check_requirements():
@@ -33,7 +40,10 @@ def main():
         )
 
     try:
-        run(init(), debug=DEBUG)
+        if options.command == "batch":
+            run(run_batch(options), debug=DEBUG)
+        else:
+            run(init(options), debug=DEBUG)
 
     except KeyboardInterrupt:
         warning("Interrupted by user")
@@ -46,6 +56,83 @@ def main():
         print("")
 
 
+def parse_args() -> Namespace:
+    parser = ArgumentParser(prog="app", description="Big Brain - Thymio Controller")
+    parser.add_argument(
+        "--calibration",
+        metavar="FILE",
+        type=Path,
+        help="load the vision calibration from a .json or .npz file,"
+        + " or save it there after calibrating if it does not exist",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIR",
+        type=Path,
+        help="record camera frames, Thymio events and commands to a directory",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="DIR",
+        type=Path,
+        help="replay a recorded session instead of using the camera and Thymio",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="replay as fast as frames are processed, instead of in real time",
+    )
+
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    batch = commands.add_parser(
+        "batch",
+        help="process recorded frames offline, without a Thymio or camera",
+        description="Extracts obstacles, landmark poses and paths from frames",
+    )
+    batch.add_argument(
+        "frames",
+        nargs="+",
+        type=Path,
+        help="image files, folders of images or recorded session folders",
+    )
+    batch.add_argument(
+        "--calibration",
+        metavar="FILE",
+        type=Path,
+        default=SUPPRESS,  # keep the value given before the command
+        help="calibration file, otherwise calibrate from the first frames",
+    )
+    batch.add_argument(
+        "--output",
+        metavar="DIR",
+        type=Path,
+        default=Path("batch"),
+        help="folder to write the results to",
+    )
+    batch.add_argument(
+        "--end",
+        metavar=("X", "Y"),
+        type=float,
+        nargs=2,
+        help="destination in cm, to plan a path from the robot in each frame",
+    )
+    batch.add_argument(
+        "--optimise",
+        action="store_true",
+        help="smooth the paths with the path optimiser",
+    )
+
+    options = parser.parse_args()
+
+    if options.record is not None and options.replay is not None:
+        parser.error("--record and --replay cannot be used together")
+
+    if options.fast and options.replay is None:
+        parser.error("--fast can only be used with --replay")
+
+    return options
+
+
 def print_banner():
     console.print(
         Padding(
@@ -106,19 +193,21 @@ def check_requirements():
     return True
 
 
-async def init():
+async def init(options: Namespace):
+    if options.replay is not None:
+        await init_replay(options)
+        return
+
     status = console.status("Connecting to Thymio driver", spinner_style="cyan")
 
     status.start()
 
     try:
         with Pool() as pool:
-            with ClientAsync() as client:
+            # Process Thymio driver messages as they arrive
+            with ClientAsync() as client, MessagePump(client) as pump:
                 status.update("Waiting for Thymio node")
 
-                # Start processing Thymio driver messages
-                create_task(process_messages(client))
-
                 with await client.lock() as node:
                     status.stop()
 
@@ -128,8 +217,9 @@ async def init():
                     info("Primary node connected")
                     debug(f"Node lock on {node}")
 
-                    # Signal the Thymio to broadcast variable changes
-                    await node.watch(variables=True)
+                    # Route variable changes to the modules that subscribe to them
+                    ctx.events.clock = pump.packet_time
+                    ctx.events.attach(node)
 
                     info("Would you like to connect a second Thymio? [Y/n]")
                     connectSecond = input("> ")
@@ -151,10 +241,10 @@ async def init():
                             info("Secondary node connected")
                             debug(f"Node lock on {secondary_node}")
 
-                            await start(ctx)
+                            await start(ctx, options)
                     else:
                         status = None
-                        await start(ctx)
+                        await start(ctx, options)
 
     except ConnectionRefusedError:
         warning("Thymio driver connection refused")
@@ -167,26 +257,55 @@ async def init():
             status.stop()
 
 
-async def start(ctx: Context):
+async def init_replay(options: Namespace):
+    """Replays a recorded session, standing in for the camera and Thymio."""
+
+    with Pool() as pool, Replay(options.replay, realtime=not options.fast) as replay:
+        ctx = Context(replay.node, None, pool, State())  # type: ignore
+        ctx.replay = replay
+
+        await start(ctx, options)
+
+
+async def start(ctx: Context, options: Namespace):
     """Start the application, launching the server and instantiating the BigBrain."""
 
     channel_position = Channel[Vec2]()
+    ctx.calibration = options.calibration
 
-    async with Server(ctx, channel_position):
-        brain = BigBrain(ctx)
-        await brain.start_thinking(channel_position)
+    with ExitStack() as stack:
+        if options.record is not None:
+            ctx.recorder = stack.enter_context(Recorder(options.record))
+            ctx.recorder.attach(ctx.node, ctx.events)
+            info(f"Recording session to {options.record}")
 
+        replay_task = None
 
-async def process_messages(client: ClientAsync):
-    """Process waiting messages from the Thymio driver."""
+        if ctx.replay is not None:
+            replay_task = create_task(ctx.replay.run(ctx, channel_position))
+            stack.callback(replay_task.cancel)
 
-    try:
-        while True:
-            client.process_waiting_messages()
-            await sleep(PROCESS_MSG_INTERVAL)
+        async with Server(ctx, channel_position):
+            brain = BigBrain(ctx)
 
-    except Exception:
-        pass
+            if replay_task is None:
+                await brain.start_thinking(channel_position)
+            else:
+                thinking = create_task(brain.start_thinking(channel_position))
+                await until_replayed(thinking, replay_task)
+
+
+async def until_replayed(thinking: Task, replay: Task):
+    """Runs the application until the replay ends, then stops it."""
+
+    done, _ = await wait([thinking, replay], return_when=FIRST_COMPLETED)
+
+    # Let the modules clean up before the server is stopped
+    thinking.cancel()
+    await gather(thinking, return_exceptions=True)
+
+    for task in done:
+        task.result()
 
 
 if __name__ == "__main__":
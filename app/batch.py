@@ -0,0 +1,277 @@
+import json
+from argparse import Namespace
+from asyncio import as_completed
+from dataclasses import dataclass, replace
+from math import atan2, nan
+from pathlib import Path
+from time import monotonic
+
+import cv2
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from app.calibration import AutoCalibrator, Calibration
+from app.config import AUTO_CALIBRATION_FRAMES, BATCH_CHUNK_SIZE, SUBDIVISIONS
+from app.context import Context
+from app.global_navigation import GlobalNavigation
+from app.path_finding.dijkstra import Dijkstra
+from app.path_finding.grid_graph import GridGraph
+from app.recording import SESSION_FILE, session_frames
+from app.state import State
+from app.utils.console import *
+from app.utils.pool import Executor, Pool, task
+from app.utils.types import Vec2
+from app.vision import Vision
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")  # frame files read from folders
+
+OBSTACLES_FILE = "obstacles.npy"  # obstacle grid of each frame
+POSES_FILE = "poses.npy"  # x, y and orientation of each frame, NaN if not found
+PATHS_FILE = "paths.npz"  # concatenated path waypoints, with per-frame offsets
+BATCH_FILE = "batch.json"  # frame sources, calibration and throughput
+
+# A frame file, or a recorded session folder and a frame index
+FrameRef = tuple[str, int | None]
+
+# Per-process caches of pool workers
+_sessions: dict[str, np.memmap | None] = {}
+_workers: dict[str, tuple[Vision, GlobalNavigation]] = {}
+
+
+@dataclass
+class FrameResult:
+    """The outcome of a frame processed in a batch."""
+
+    obstacles: np.ndarray
+    pose: tuple[float, float, float] | None
+    path: list[Vec2] | None
+
+
+def list_frames(paths: list[Path]) -> list[FrameRef]:
+    """
+    Lists the frames of image files, folders of image files and recorded
+    session folders, without reading them.
+    """
+
+    frames: list[FrameRef] = []
+
+    for path in paths:
+        if (path / SESSION_FILE).exists():
+            images = session_frames(path)
+            count = len(images) if images is not None else 0
+            frames.extend((str(path), index) for index in range(count))
+
+        elif path.is_dir():
+            frames.extend(
+                (str(file), None)
+                for file in sorted(path.iterdir())
+                if file.suffix.lower() in IMAGE_EXTENSIONS
+            )
+
+        else:
+            frames.append((str(path), None))
+
+    return frames
+
+
+def read_frame(frame: FrameRef) -> np.ndarray:
+    """Reads a listed frame, memory-mapping sessions once per process."""
+
+    path, index = frame
+
+    if index is None:
+        image = cv2.imread(path)
+
+        if image is None:
+            raise RuntimeError(f"Could not read frame {path}")
+
+        return image
+
+    if path not in _sessions:
+        _sessions[path] = session_frames(path)
+
+    return np.asarray(_sessions[path][index])  # type: ignore
+
+
+async def run_batch(options: Namespace):
+    """
+    Runs vision and path planning on every frame, spreading chunks of frames
+    over the process pool. Results are written to the output folder as they
+    arrive, in frame order, with fixed-size arrays memory-mapped on disk.
+    """
+
+    frames = list_frames(options.frames)
+
+    if not frames:
+        error("No frames to process")
+        return
+
+    calibration = _calibration(options.calibration, frames)
+
+    if calibration is None:
+        error("Could not calibrate from the frames")
+        return
+
+    # Workers rebuild the tables, only send the calibration parameters
+    calibration = replace(calibration, remap=None, lut=None, reference=None)
+    end = tuple(options.end) if options.end is not None else None
+
+    size = BATCH_CHUNK_SIZE
+    chunks = [frames[i : i + size] for i in range(0, len(frames), size)]
+
+    output: Path = options.output
+    output.mkdir(parents=True, exist_ok=True)
+
+    obstacles = open_memmap(
+        output / OBSTACLES_FILE,
+        mode="w+",
+        dtype=np.int8,
+        shape=(len(frames), SUBDIVISIONS, SUBDIVISIONS),
+    )
+    poses = open_memmap(
+        output / POSES_FILE, mode="w+", dtype=np.float32, shape=(len(frames), 3)
+    )
+    paths: list[list[Vec2] | None] = [None] * len(frames)
+
+    info(f"Processing {len(frames)} frames in {len(chunks)} chunks")
+
+    start = monotonic()
+    processed = found = 0
+
+    with Pool() as pool:
+
+        async def run_chunk(index: int):
+            results = await pool.run(
+                process_chunk, calibration, chunks[index], end, options.optimise
+            )
+            return index * size, results
+
+        for completed in as_completed([run_chunk(i) for i in range(len(chunks))]):
+            first, results = await completed
+
+            for i, result in enumerate(results, first):
+                obstacles[i] = result.obstacles
+                poses[i] = result.pose if result.pose is not None else (nan,) * 3
+                paths[i] = result.path
+                found += result.pose is not None
+
+            processed += len(results)
+            elapsed = monotonic() - start
+            verbose(
+                f"\\[batch] {processed}/{len(frames)} frames,"
+                + f" {processed / elapsed:.1f} frames/s"
+            )
+
+    elapsed = monotonic() - start
+
+    obstacles.flush()
+    poses.flush()
+    _save_paths(output / PATHS_FILE, paths)
+
+    with (output / BATCH_FILE).open("w") as file:
+        json.dump(
+            {
+                "frames": [list(frame) for frame in frames],
+                "calibration": calibration.parameters(),
+                "end": end,
+                "optimise": options.optimise,
+                "found": found,
+                "elapsed": elapsed,
+                "throughput": len(frames) / elapsed,
+            },
+            file,
+            indent=2,
+        )
+
+    info(
+        f"Processed {len(frames)} frames in {elapsed:.1f} s"
+        + f" ({len(frames) / elapsed:.1f} frames/s),"
+        + f" landmarks found in {found}"
+    )
+    info(f"Results written to {output}")
+
+
+@task(Executor.Process)
+def process_chunk(
+    calibration: Calibration,
+    frames: list[FrameRef],
+    end: Vec2 | None,
+    optimise: bool,
+) -> list[FrameResult]:
+    """
+    Extracts the obstacles and landmarks of each frame, and plans a path from
+    the robot to the destination if one is given. Runs in a pool process,
+    which keeps its vision system between chunks of the same calibration.
+    """
+
+    vision, navigation = _worker(calibration)
+    results = []
+
+    for frame in frames:
+        map = vision._process_image(read_frame(frame))
+        obstacles = vision._find_obstacles(map)
+        back, front = vision._find_landmarks(map)
+
+        if back is None or front is None:
+            results.append(FrameResult(obstacles, None, None))
+            continue
+
+        (bx, by) = vision._to_physical_space(back)
+        (fx, fy) = vision._to_physical_space(front)
+        pose = (bx, by, atan2(fy - by, fx - bx))
+        path = None
+
+        if end is not None:
+            graph = GridGraph(navigation._generate_map(obstacles, None, []))
+            locations = Dijkstra(graph, optimise).find_path(
+                navigation._to_location((bx, by)), navigation._to_location(end)
+            )
+
+            if locations is not None:
+                path = navigation._path_to_coords(locations)
+
+        results.append(FrameResult(obstacles, pose, path))
+
+    return results
+
+
+def _worker(calibration: Calibration) -> tuple[Vision, GlobalNavigation]:
+    """Returns the vision and navigation systems of this process."""
+
+    key = json.dumps(calibration.parameters())
+
+    if key not in _workers:
+        ctx = Context(None, None, None, State())  # type: ignore
+        vision = Vision(ctx, live=False, tracking=False)
+        vision.timings = None
+        vision._apply_calibration(calibration)
+
+        _workers[key] = (vision, GlobalNavigation(ctx))
+
+    return _workers[key]
+
+
+def _calibration(path: Path | None, frames: list[FrameRef]) -> Calibration | None:
+    """Loads the calibration file, or calibrates from the first frames."""
+
+    if path is not None:
+        return Calibration.load(path)
+
+    images = [read_frame(frame) for frame in frames[:AUTO_CALIBRATION_FRAMES]]
+    return AutoCalibrator().calibrate(images)
+
+
+def _save_paths(path: Path, paths: list[list[Vec2] | None]):
+    """
+    Saves variable-length paths as concatenated waypoints, where the path of
+    frame `i` is `points[offsets[i]:offsets[i + 1]]`, empty if none was found.
+    """
+
+    lengths = [len(waypoints) if waypoints else 0 for waypoints in paths]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    points = np.array(
+        [point for waypoints in paths if waypoints for point in waypoints],
+        dtype=np.float32,
+    ).reshape(-1, 2)
+
+    np.savez_compressed(path, points=points, offsets=offsets)
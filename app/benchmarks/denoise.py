@@ -0,0 +1,151 @@
+"""
+Compares the obstacle image denoising strategies on recorded frames, reporting
+the time per frame and how closely the obstacle grid and landmark positions
+agree with the bilateral filter, to pick the cheapest acceptable strategy.
+
+    python -m app.benchmarks.denoise [FRAMES ...] [--calibration FILE]
+"""
+
+from argparse import ArgumentParser
+from math import dist
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+from rich.table import Table
+
+from app.benchmarks.frames import calibrated_vision, load_frames
+from app.utils.console import *
+from app.vision import TEST_IMAGE_PATH, Denoise, Vision
+
+BASELINE = Denoise.Bilateral  # strategy that the others are compared to
+
+
+def main():
+    parser = ArgumentParser(
+        prog="app.benchmarks.denoise", description="Denoise strategy benchmark"
+    )
+    parser.add_argument(
+        "frames",
+        nargs="*",
+        type=Path,
+        default=[Path(TEST_IMAGE_PATH)],
+        help="image files, folders of images or recorded session folders",
+    )
+    parser.add_argument(
+        "--calibration",
+        metavar="FILE",
+        type=Path,
+        help="calibration file, otherwise calibrate from the first frames",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=100, help="maximum number of frames to use"
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=20, help="number of runs of each frame"
+    )
+    options = parser.parse_args()
+
+    frames = load_frames(options.frames, options.limit)
+
+    if not frames:
+        error("No frames to benchmark")
+        return
+
+    info(f"Benchmarking {len(Denoise)} denoise strategies on {len(frames)} frames")
+
+    vision = calibrated_vision(frames, options.calibration)
+    maps = [vision._process_image(frame) for frame in frames]
+
+    results = {
+        strategy: run(vision, strategy, maps, options.iterations)
+        for strategy in Denoise
+    }
+
+    console.print(report(results))
+
+
+def run(vision: Vision, strategy: Denoise, maps: list, iterations: int) -> dict:
+    """
+    Runs a strategy on each rectified frame, timing the denoising and the
+    full obstacle extraction, and returns the timings and the outputs.
+    """
+
+    vision.denoise = strategy
+    vision.timings = None
+
+    denoise_times = []
+    obstacle_times = []
+    grids = []
+    landmarks = []
+
+    for map in maps:
+        for _ in range(iterations):
+            start = perf_counter()
+            downscaled = vision._downscale(map)
+            denoise_start = perf_counter()
+            denoised = vision._denoise(downscaled)
+            denoise_end = perf_counter()
+            grid = vision._segment_obstacles(denoised)
+            end = perf_counter()
+
+            denoise_times.append(denoise_end - denoise_start)
+            obstacle_times.append(end - start)
+
+        grids.append(np.asarray(grid))
+        landmarks.append(vision._find_landmarks(map))
+
+    return {
+        "denoise": denoise_times,
+        "obstacles": obstacle_times,
+        "grids": grids,
+        "landmarks": landmarks,
+    }
+
+
+def report(results: dict[Denoise, dict]) -> Table:
+    """Tabulates the median timings and the agreement with the baseline."""
+
+    baseline = results[BASELINE]
+
+    table = Table(title="Denoise strategies")
+    table.add_column("Strategy")
+    table.add_column("Denoise (ms)", justify="right")
+    table.add_column("Obstacles (ms)", justify="right")
+    table.add_column("Grid agreement", justify="right")
+    table.add_column("Landmark offset (px)", justify="right")
+
+    for strategy, result in results.items():
+        agreement = np.mean(
+            [np.mean(a == b) for a, b in zip(result["grids"], baseline["grids"])]
+        )
+
+        table.add_row(
+            strategy.value,
+            f"{np.median(result['denoise']) * 1000:.3f}",
+            f"{np.median(result['obstacles']) * 1000:.3f}",
+            f"{agreement:.2%}",
+            landmark_offset(result["landmarks"], baseline["landmarks"]),
+        )
+
+    return table
+
+
+def landmark_offset(landmarks: list, baseline: list) -> str:
+    """The largest distance between landmarks found in both, or which were lost."""
+
+    offsets = []
+
+    for found, expected in zip(landmarks, baseline):
+        for a, b in zip(found, expected):
+            if (a is None) != (b is None):
+                return "lost"
+
+            if a is not None:
+                offsets.append(dist(a, b))
+
+    return f"{max(offsets, default=0.0):.1f}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from app.batch import list_frames, read_frame
+from app.calibration import AutoCalibrator, Calibration
+from app.config import AUTO_CALIBRATION_FRAMES
+from app.context import Context
+from app.state import State
+from app.vision import Image, Vision
+
+
+def load_frames(paths: list[Path], limit: int | None = None) -> list[Image]:
+    """
+    Loads camera frames from image files, folders of image files and
+    recorded session folders, keeping at most `limit` frames.
+    """
+
+    return [read_frame(frame) for frame in list_frames(paths)[:limit]]
+
+
+def calibrated_vision(
+    frames: list[Image], calibration: Path | None = None, **options
+) -> Vision:
+    """
+    Creates a vision system without a camera, calibrated from a calibration
+    file or automatically from the first frames. Landmarks are searched in
+    the full frame, as there is no position estimate to track them from.
+    """
+
+    options.setdefault("tracking", False)
+    ctx = Context(None, None, None, State())  # type: ignore
+    vision = Vision(ctx, live=False, **options)
+
+    if calibration is not None:
+        found = Calibration.load(calibration)
+    else:
+        found = AutoCalibrator().calibrate(frames[:AUTO_CALIBRATION_FRAMES])
+
+    if found is None:
+        raise RuntimeError("Could not calibrate from the frames")
+
+    vision._apply_calibration(found)
+    return vision
+
@@ -0,0 +1,204 @@
+"""
+Times each stage of the vision system and the full `Vision.next()` on stored
+frames, at several `PIXELS_PER_CM` settings, and writes the results as JSON.
+Frames are fed through a frame buffer, no camera is opened.
+
+    python -m app.benchmarks.vision [FRAMES ...] [--calibration FILE]
+"""
+
+import json
+import multiprocessing
+import platform
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+
+import cv2
+import numpy as np
+from rich.table import Table
+
+import app.config
+from app.utils.console import *
+
+DEFAULT_FRAMES = "assets/test_frame_01.jpg"  # frame benchmarked by default
+DEFAULT_CALIBRATION = "assets/test_frame_01.calib.json"  # and its calibration
+DEFAULT_PIXELS_PER_CM = [3, 4, 5, 6]  # resolutions of the rectified board
+DEFAULT_OUTPUT = "vision_benchmark.json"  # results file
+
+
+def main():
+    parser = ArgumentParser(
+        prog="app.benchmarks.vision", description="Vision benchmark suite"
+    )
+    parser.add_argument(
+        "frames",
+        nargs="*",
+        type=Path,
+        default=[Path(DEFAULT_FRAMES)],
+        help="image files, folders of images or recorded session folders",
+    )
+    parser.add_argument(
+        "--calibration",
+        metavar="FILE",
+        type=Path,
+        help="calibration file, otherwise calibrate from the first frames"
+        + f" (defaults to {DEFAULT_CALIBRATION} for the default frame)",
+    )
+    parser.add_argument(
+        "--pixels-per-cm",
+        metavar="N",
+        type=int,
+        nargs="+",
+        default=DEFAULT_PIXELS_PER_CM,
+        help="PIXELS_PER_CM settings to benchmark",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=100, help="maximum number of frames to use"
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=50, help="number of runs of each frame"
+    )
+    parser.add_argument(
+        "--gate",
+        action="store_true",
+        help="let the obstacle gate skip static frames, as in the live loop",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        type=Path,
+        default=Path(DEFAULT_OUTPUT),
+        help="JSON file to write the results to",
+    )
+    options = parser.parse_args()
+
+    if options.calibration is None and options.frames == [Path(DEFAULT_FRAMES)]:
+        options.calibration = Path(DEFAULT_CALIBRATION)
+
+    # Settings are baked into the vision module when it is imported, so each
+    # one is benchmarked in a fresh process, one at a time to avoid contention
+    context = multiprocessing.get_context("spawn")
+    settings = []
+
+    for pixels_per_cm in options.pixels_per_cm:
+        info(f"Benchmarking vision at {pixels_per_cm} pixels per cm")
+
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            result = executor.submit(
+                benchmark,
+                pixels_per_cm,
+                options.frames,
+                options.calibration,
+                options.limit,
+                options.iterations,
+                options.gate,
+            ).result()
+
+        settings.append(result)
+
+    results = {
+        "frames": [str(path) for path in options.frames],
+        "calibration": str(options.calibration) if options.calibration else None,
+        "iterations": options.iterations,
+        "gate": options.gate,
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": multiprocessing.cpu_count(),
+        "settings": settings,
+    }
+
+    with options.output.open("w") as file:
+        json.dump(results, file, indent=2)
+
+    console.print(report(settings))
+    info(f"Results written to {options.output}")
+
+
+def benchmark(
+    pixels_per_cm: int,
+    paths: list[Path],
+    calibration: Path | None,
+    limit: int,
+    iterations: int,
+    gate: bool,
+) -> dict:
+    """
+    Runs the vision system on the frames at a given resolution, in a fresh
+    process, returning the p50, p95 and maximum duration of each stage.
+    """
+
+    app.config.PIXELS_PER_CM = pixels_per_cm
+
+    # Import the vision system now that its configuration is set
+    from app.benchmarks.frames import calibrated_vision, load_frames
+    from app.capture import FrameBuffer
+    from app.utils.timing import StageTimings
+    from app.vision import IMAGE_PROCESSING_DIM
+
+    frames = load_frames(paths, limit)
+
+    if not frames:
+        raise RuntimeError("No frames to benchmark")
+
+    vision = calibrated_vision(frames, calibration)
+    vision.capture = FrameBuffer()
+    missed = 0
+
+    # The first pass warms up caches and OpenCV, and is not recorded
+    for timed in (False, True):
+        vision.timings = StageTimings(len(frames) * iterations)
+
+        for _ in range(iterations if timed else 1):
+            for image in frames:
+                if not gate:
+                    vision._gate_reference = None
+
+                vision.capture.publish(image)
+
+                start = perf_counter()
+                observation = vision.next()
+                vision.timings.record("next", perf_counter() - start)
+
+                missed += timed and observation is None
+
+    return {
+        "pixels_per_cm": pixels_per_cm,
+        "image_dim": IMAGE_PROCESSING_DIM,
+        "frames": len(frames),
+        "missed": missed,
+        "stages": vision.timings.summary(),
+    }
+
+
+def report(settings: list[dict]) -> Table:
+    """Tabulates the median duration of each stage, for each setting."""
+
+    table = Table(title="Vision stages, p50 (ms)")
+    table.add_column("Stage")
+
+    for setting in settings:
+        table.add_column(f"{setting['pixels_per_cm']} px/cm", justify="right")
+
+    stages = dict.fromkeys(
+        stage for setting in settings for stage in setting["stages"]
+    )
+
+    for stage in stages:
+        table.add_row(
+            stage,
+            *(
+                f"{setting['stages'][stage]['p50'] * 1000:.3f}"
+                if stage in setting["stages"]
+                else "-"
+                for setting in settings
+            ),
+        )
+
+    return table
+
+
+if __name__ == "__main__":
+    main()
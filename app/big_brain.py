@@ -1,8 +1,7 @@
 import math
-from asyncio import sleep
+from asyncio import create_task
 from dataclasses import dataclass
-
-import numpy as np
+from time import monotonic
 
 from app.christmas import ChristmasCelebration
 from app.config import *
@@ -11,7 +10,6 @@ from app.filtering import Filtering
 from app.global_navigation import GlobalNavigation
 from app.local_navigation import LocalNavigation
 from app.motion_control import MotionControl
-from app.path_finding.types import Map
 from app.utils.console import *
 from app.utils.outlier_rejecter import OutlierRejecter
 from app.utils.types import Channel, Vec2
@@ -30,6 +28,12 @@ class Modules:
     motion_control: MotionControl
     vision: Vision
 
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Returns the event processing statistics of each module"""
+
+        modules = [self.filtering, self.global_nav, self.local_nav, self.motion_control]
+        return {module.name: module.stats.json() for module in modules}
+
 
 class BigBrain:
     def __init__(self, ctx: Context):
@@ -45,18 +49,27 @@ class BigBrain:
             if not modules.vision.calibrate():
                 return
 
-            with modules.filtering, modules.motion_control, modules.global_nav, modules.local_nav:
+            # Process frames in the background, off the event loop
+            vision_task = create_task(modules.vision.run())
+
+            try:
+                with modules.filtering, modules.motion_control, modules.global_nav, modules.local_nav:
+
+                    # Signal the Thymio to broadcast the subscribed variables
+                    await self.ctx.events.watch(self.ctx.node)
 
-                await self.loop(modules)
+                    await self.loop(modules)
+
+            finally:
+                vision_task.cancel()
 
     def init(self):
         """Initialise the big brain"""
 
         self.stop_requested = False
 
-        # Initialise the obstacle NDArray
-        subdivs = self.ctx.state.subdivisions
-        self.ctx.state.obstacles = np.zeros((subdivs, subdivs), dtype=np.int8)
+        # The obstacle map is owned by the tracker and updated in place
+        self.ctx.state.obstacles = self.ctx.obstacles.map
 
     def init_modules(self, rx_pos: Channel[Vec2]):
         """Initialise the modules"""
@@ -75,10 +88,14 @@ class BigBrain:
         front_rejecter = OutlierRejecter[Vec2](2, 5)
         orientation_rejecter = OutlierRejecter[float](0.1, 5)
 
+        last_stats = monotonic()
+        last_timings_log = monotonic()
+        scene_changes = 0
+
         while True:
 
-            # get frame reading from vision module
-            obs = modules.vision.next()
+            # wait for the latest finished observation from the vision module
+            obs = await modules.vision.observations.recv_latest(UPDATE_FREQUENCY)
 
             if obs:
 
@@ -100,13 +117,27 @@ class BigBrain:
                 self.ctx.state.last_detection = back
                 self.ctx.state.last_detection_front = front
                 self.ctx.state.last_orientation = orientation
+                self.ctx.state.vision_latency = obs.latency
                 self.ctx.state.changed()
 
-                # update obstacle map with camera reading
-                # only if consequential change
-                if self.significant_change(obs.obstacles):
-                    self.ctx.state.obstacles = obs.obstacles
-                    self.ctx.scene_update.trigger()
+                # update obstacle map with camera reading, publishing only
+                # the cells that changed and replanning once enough did
+                delta = self.ctx.obstacles.update(obs.obstacles)
+
+                if delta is not None:
+                    self.ctx.state.obstacle_changes = delta
+                    self.ctx.state.obstacles_version = delta.version
+                    self.ctx.state.obstacle_polygons = (
+                        modules.vision.obstacle_polygons(self.ctx.obstacles.map)
+                    )
+                    self.ctx.state.obstacle_polygons_version = delta.version
+                    self.ctx.state.changed()
+
+                    scene_changes += len(delta)
+
+                    if scene_changes > SCENE_THRESHOLD:
+                        scene_changes = 0
+                        self.ctx.scene_update.trigger()
 
             # trigger celebration if end of path is reached
             if self.ctx.state.arrived == True:
@@ -119,27 +150,42 @@ class BigBrain:
                 if self.ctx.node_top != None:
                     await self.christmas_celebration.drop_bauble()
 
-            self.ctx.debug_update = False
-            await sleep(UPDATE_FREQUENCY)
+            # publish module queue depths, processing times and capture rates
+            if monotonic() - last_stats > MODULE_STATS_INTERVAL:
+                last_stats = monotonic()
+                self.ctx.state.module_stats = modules.stats()
 
-    def _angle(self, p1: Vec2, p2: Vec2) -> float:
-        """Returns the angle of the vector between two points in radians."""
+                if modules.vision.capture is not None:
+                    self.ctx.state.capture_rate = modules.vision.capture.rate
+                    self.ctx.state.dropped_frames = (
+                        modules.vision.capture.dropped + modules.vision.pipeline_dropped
+                    )
 
-        return math.atan2(p2[1] - p1[1], p2[0] - p1[0])
+                processed = modules.vision.obstacle_frames_processed
+                skipped = modules.vision.obstacle_frames_skipped
+
+                if skipped != self.ctx.state.obstacle_frames_skipped:
+                    verbose(
+                        f"\\[vision] Obstacles extracted on {processed} frames,"
+                        + f" skipped on {skipped} static frames"
+                    )
+
+                self.ctx.state.obstacle_frames_processed = processed
+                self.ctx.state.obstacle_frames_skipped = skipped
 
-    def significant_change(self, obstacles: Map, threshold=SCENE_THRESHOLD) -> bool:
-        """
-        Returns true if the scene has changed significantly. This is gauged by the
-        amount of changes in the obstacles matrix. If this exceeds a set threshold,
-        the scene is considered to have changed significantly.
-        """
+                # publish rolling vision stage timings, logging them less often
+                timings = modules.vision.timings
 
-        if self.ctx.state.obstacles is None:
-            return False
+                if timings is not None:
+                    self.ctx.state.vision_timings = timings.summary()
 
-        return self.matrix_distance(self.ctx.state.obstacles, obstacles) > threshold
+                    if last_stats - last_timings_log > VISION_TIMINGS_LOG_INTERVAL:
+                        last_timings_log = last_stats
+                        verbose(f"\\[vision] Stage timings\n{timings.format()}")
 
-    def matrix_distance(self, a: Map, b: Map) -> int:
-        """Returns the L1 distance between two matrices of the same size"""
+                self.ctx.state.changed()
 
-        return np.sum(np.sum(np.abs(b - a)))
+    def _angle(self, p1: Vec2, p2: Vec2) -> float:
+        """Returns the angle of the vector between two points in radians."""
+
+        return math.atan2(p2[1] - p1[1], p2[0] - p1[0])
@@ -0,0 +1,205 @@
+from asyncio import BaseTransport, Event, Task, create_task, sleep
+from time import monotonic
+from traceback import print_exc
+from typing import Any
+
+from aiohttp.web import WebSocketResponse
+
+from app.config import PATCH_BUFFER_LIMIT, PATCH_RATE
+from app.protocol import encode
+from app.state import State, merge_change
+from app.utils.console import *
+
+Patch = dict[str, Any]
+
+
+class Subscriber:
+    """
+    A client receiving state patches. Each client sends from its own task,
+    holding at most one patch: a client still sending the previous patch
+    when the next one is published has fallen behind, and the patches are
+    merged into one that is encoded for this client alone.
+
+    Patches are sent at most `rate` times per second, and not at all while
+    the socket's write buffer is full, so that a slow client only receives
+    the latest value of each field instead of every intermediate state.
+    """
+
+    def __init__(
+        self,
+        ws: WebSocketResponse,
+        binary: bool,
+        transport: BaseTransport | None,
+        rate: float = PATCH_RATE,
+    ):
+        self.ws = ws
+        self.binary = binary
+        self.interval = 1 / rate
+
+        self._transport = transport
+        self._patch: Patch | None = None
+        self._message: str | bytes | None = None  # shared encoding of the patch
+        self._ready = Event()
+        self._task: Task | None = None
+        self._sent = 0.0  # time at which the last patch was sent
+
+    @property
+    def behind(self) -> bool:
+        return self._patch is not None
+
+    @property
+    def congested(self) -> bool:
+        """Whether the client has yet to receive much of what was sent."""
+
+        transport = self._transport
+
+        if transport is None or transport.is_closing():
+            return False
+
+        return transport.get_write_buffer_size() > PATCH_BUFFER_LIMIT
+
+    def start(self):
+        """Starts sending patches, once the initial state has been sent."""
+
+        self._task = create_task(self._send_patches())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def offer(self, patch: Patch, message: str | bytes | None = None):
+        """Queues a patch, with its shared encoding if the client kept up."""
+
+        if self._patch is None:
+            self._patch = patch
+            self._message = message
+
+        else:
+            self._patch = merge_patches(self._patch, patch)
+            self._message = None
+
+        self._ready.set()
+
+    async def _send_patches(self):
+        try:
+            while True:
+                await self._ready.wait()
+
+                # Patches published while waiting are merged into this one
+                await sleep(self._sent + self.interval - monotonic())
+
+                while self.congested:
+                    await sleep(self.interval)
+
+                self._ready.clear()
+
+                patch, message = self._patch, self._message
+                self._patch = self._message = None
+
+                if patch is None:
+                    continue
+
+                if message is None:
+                    message = encode("patch", patch, self.binary)
+
+                if isinstance(message, bytes):
+                    await self.ws.send_bytes(message)
+                else:
+                    await self.ws.send_str(message)
+
+                self._sent = monotonic()
+
+        except ConnectionResetError:
+            pass
+
+        except Exception:
+            error("\\[server] Error sending patch!")
+            print_exc()
+
+
+class Broadcast:
+    """
+    Sends the state patches to all clients. A single listener collects the
+    changes to the state, and each patch is encoded once per protocol and
+    shared by every client that is keeping up.
+
+    Changes are published at most `rate` times per second, those made in
+    between are merged by the listener into the next patch.
+    """
+
+    def __init__(self, state: State, rate: float = PATCH_RATE):
+        self.state = state
+        self.interval = 1 / rate
+        self.subscribers: list[Subscriber] = []
+
+        self.patches = 0
+        self.encodings = 0
+
+        self._task: Task | None = None
+
+    def __enter__(self):
+        self._listener = self.state.register_listener()
+        self._task = create_task(self._broadcast())
+        return self
+
+    def __exit__(self, *_):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        self.state.unregister_listener(self._listener)
+
+    def subscribe(
+        self, ws: WebSocketResponse, binary: bool, transport: BaseTransport | None
+    ) -> Subscriber:
+        """
+        Adds a client. Patches are held for the client until it is started,
+        so subscribe right after taking the state sent to the client.
+        """
+
+        subscriber = Subscriber(ws, binary, transport, 1 / self.interval)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.stop()
+        self.subscribers.remove(subscriber)
+
+    async def _broadcast(self):
+        while True:
+            await self._listener.wait_for_patch()
+            start = monotonic()
+            patch = self._listener.get_patch(serialise=False)
+
+            if not patch:
+                continue
+
+            self.patches += 1
+            messages: dict[bool, str | bytes] = {}
+
+            for subscriber in self.subscribers:
+                binary = subscriber.binary
+
+                if subscriber.behind:
+                    subscriber.offer(patch)
+                    continue
+
+                if binary not in messages:
+                    messages[binary] = encode("patch", patch, binary)
+                    self.encodings += 1
+
+                subscriber.offer(patch, messages[binary])
+
+            await sleep(start + self.interval - monotonic())
+
+
+def merge_patches(older: Patch, newer: Patch) -> Patch:
+    """Merges two consecutive patches into one, the newer values winning."""
+
+    merged = dict(older)
+
+    for key, value in newer.items():
+        merged[key] = merge_change(merged[key], value) if key in merged else value
+
+    return merged
@@ -0,0 +1,306 @@
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from app.config import (
+    LM_BACK,
+    LM_BACK_HUE,
+    LM_FRONT,
+    LM_FRONT_HUE,
+    PIXELS_PER_CM,
+    TABLE_LEN,
+)
+from app.utils.console import *
+from app.utils.types import Coords
+
+CALIBRATION_VERSION = 1
+
+# Automatic calibration
+BACKGROUND_HUES = ((0, 20), (140, 180))  # hue ranges of the wooden floor
+BACKGROUND_MIN_SATURATION = 20  # minimum saturation of the wooden floor
+BOARD_MIN_VALUE = 60  # minimum brightness of the board, darker pixels are obstacles
+BOARD_MIN_AREA = 0.2  # minimum fraction of the frame covered by the board
+BOARD_OPEN_SIZE = 5  # size of the kernel removing noise from the board mask
+CORNER_EPSILONS = np.linspace(0.005, 0.1, 20)  # polygon approximation tolerances
+LANDMARK_MIN_SATURATION = 80  # minimum saturation of a landmark
+LANDMARK_MIN_VALUE = 60  # minimum brightness of a landmark
+LANDMARK_MIN_FILL = 0.6  # minimum fraction of its bounding box covered by a landmark
+LANDMARK_AREA_RANGE = (0.5, 2.0)  # landmark area range relative to its nominal area
+LANDMARK_HUE_TOLERANCE = 20  # maximum hue difference from the nominal landmark hue
+
+PIXEL_MAX = 255  # Maximum pixel value
+
+Colour = tuple[int, int, int]
+Image = cv2.Mat
+
+
+@dataclass
+class Calibration:
+    """
+    The vision calibration: the board corners in the camera frame and the
+    landmark colours, along with the remap and colour lookup tables derived
+    from them and the settings they were built with.
+
+    Calibrations are saved as `.json` (parameters only, easy to edit by hand)
+    or `.npz` (parameters and precomputed tables, for an instant startup).
+    """
+
+    frame_shape: tuple[int, ...]
+    corners: list[Coords]
+    back_colour: Colour
+    front_colour: Colour
+    settings: dict[str, Any] = field(default_factory=dict)
+
+    # Derived tables, rebuilt if missing or built with different settings
+    remap: tuple[npt.NDArray, npt.NDArray] | None = None
+    lut: npt.NDArray[np.uint8] | None = None
+    reference: npt.NDArray[np.uint8] | None = None  # board thumbnail
+
+    def parameters(self) -> dict[str, Any]:
+        return {
+            "version": CALIBRATION_VERSION,
+            "frame_shape": list(self.frame_shape),
+            "corners": [list(corner) for corner in self.corners],
+            "back_colour": list(self.back_colour),
+            "front_colour": list(self.front_colour),
+            "settings": self.settings,
+        }
+
+    def save(self, path: Path):
+        if path.suffix == ".json":
+            with path.open("w") as file:
+                json.dump(self.parameters(), file, indent=2)
+
+        else:
+            tables = {}
+
+            if self.remap is not None:
+                tables["remap_xy"], tables["remap_a"] = self.remap
+
+            if self.lut is not None:
+                tables["lut"] = self.lut
+
+            if self.reference is not None:
+                tables["reference"] = self.reference
+
+            with path.open("wb") as file:
+                np.savez_compressed(
+                    file, parameters=json.dumps(self.parameters()), **tables
+                )
+
+        info(f"Calibration saved to {path}")
+
+    @staticmethod
+    def load(path: Path) -> "Calibration":
+        """
+        Loads a calibration file. Raises a `ValueError` if the file is not a
+        calibration, or was written by an unsupported version.
+        """
+
+        if path.suffix == ".json":
+            with path.open() as file:
+                return Calibration._from_parameters(json.load(file))
+
+        with np.load(path) as data:
+            calibration = Calibration._from_parameters(
+                json.loads(str(data["parameters"]))
+            )
+
+            if "remap_xy" in data and "remap_a" in data:
+                calibration.remap = (data["remap_xy"], data["remap_a"])
+
+            if "lut" in data:
+                calibration.lut = data["lut"]
+
+            if "reference" in data:
+                calibration.reference = data["reference"]
+
+        return calibration
+
+    @staticmethod
+    def _from_parameters(parameters: Any) -> "Calibration":
+        if not isinstance(parameters, dict) or "version" not in parameters:
+            raise ValueError("Not a versioned calibration file")
+
+        if parameters["version"] != CALIBRATION_VERSION:
+            raise ValueError(f"Unsupported calibration version {parameters['version']}")
+
+        return Calibration(
+            tuple(parameters["frame_shape"]),
+            [tuple(corner) for corner in parameters["corners"]],  # type: ignore
+            tuple(parameters["back_colour"]),  # type: ignore
+            tuple(parameters["front_colour"]),  # type: ignore
+            parameters.get("settings", {}),
+        )
+
+
+class AutoCalibrator:
+    """
+    Calibrates the vision system without user input. The board is found as
+    the largest region that is neither the wooden floor nor dark, and its
+    corners are the vertices of its convex hull simplified to a
+    quadrilateral. The landmarks are the saturated, round blobs of the
+    corrected board whose hue is closest to their nominal hue, and their
+    colours are measured under the current lighting.
+    """
+
+    def calibrate(self, images: list[Image]) -> Calibration | None:
+        """
+        Estimates a calibration from several frames, taking the median of the
+        corners and colours found in each. Returns None unless the board and
+        landmarks were found in at least half of the frames.
+        """
+
+        found = []
+
+        for image in images:
+            corners = self.find_corners(image)
+
+            if corners is None:
+                continue
+
+            colours = self.find_landmark_colours(image, corners)
+
+            if colours is not None:
+                found.append((corners, *colours))
+
+        if len(found) == 0 or len(found) < len(images) / 2:
+            return None
+
+        corners, back, front = (np.median(np.array(x), axis=0) for x in zip(*found))
+
+        return Calibration(
+            images[0].shape,
+            [(int(round(x)), int(round(y))) for x, y in corners],
+            tuple(int(c) for c in back),  # type: ignore
+            tuple(int(c) for c in front),  # type: ignore
+        )
+
+    def find_corners(self, image: Image) -> npt.NDArray[np.float32] | None:
+        """
+        Finds the board corners in a camera frame, ordered as top-left,
+        top-right, bottom-right and bottom-left. Returns None if no board
+        was found.
+        """
+
+        hue, saturation, value = cv2.split(cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
+
+        # The floor is saturated enough for its hue to be reliable
+        background = np.zeros(hue.shape, dtype=bool)
+
+        for low, high in BACKGROUND_HUES:
+            background |= (hue >= low) & (hue < high)
+
+        background &= saturation >= BACKGROUND_MIN_SATURATION
+
+        board = ~background & (value >= BOARD_MIN_VALUE)
+        mask = np.where(board, PIXEL_MAX, 0).astype(np.uint8)
+        kernel = np.ones((BOARD_OPEN_SIZE, BOARD_OPEN_SIZE), np.uint8)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+        contours, _ = cv2.findContours(
+            mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+
+        if len(contours) == 0:
+            return None
+
+        # Obstacles on the board leave holes, its convex hull covers them
+        hull = cv2.convexHull(max(contours, key=cv2.contourArea))
+
+        if cv2.contourArea(hull) < BOARD_MIN_AREA * mask.size:
+            return None
+
+        perimeter = cv2.arcLength(hull, True)
+
+        for epsilon in CORNER_EPSILONS:
+            polygon = cv2.approxPolyDP(hull, epsilon * perimeter, True)
+
+            if len(polygon) == 4:
+                return self._order_corners(polygon.reshape(4, 2).astype(np.float32))
+
+        return None
+
+    def find_landmark_colours(
+        self, image: Image, corners: npt.NDArray[np.float32]
+    ) -> tuple[Colour, Colour] | None:
+        """
+        Measures the (back, front) landmark colours on the board delimited by
+        the given corners. Returns None if either landmark was not found.
+        """
+
+        dim = PIXELS_PER_CM * TABLE_LEN
+        l = dim - 1
+        square = np.array([[0, 0], [l, 0], [l, l], [0, l]], dtype=np.float32)
+        homography = cv2.getPerspectiveTransform(corners, square)
+        board = cv2.warpPerspective(image, homography, (dim, dim))
+
+        hsv = cv2.cvtColor(board, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(
+            hsv, (0, LANDMARK_MIN_SATURATION, LANDMARK_MIN_VALUE), (180, 255, 255)
+        )
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(mask)
+
+        smallest = self._landmark_area(min(LM_BACK, LM_FRONT)) * LANDMARK_AREA_RANGE[0]
+        largest = self._landmark_area(max(LM_BACK, LM_FRONT)) * LANDMARK_AREA_RANGE[1]
+
+        # Saturated round blobs of a landmark's size, with their median hue
+        blobs = []
+
+        for label in range(1, count):
+            _, _, width, height, area = stats[label]
+
+            if not smallest <= area <= largest:
+                continue
+
+            if area < LANDMARK_MIN_FILL * width * height:
+                continue
+
+            pixels = labels == label
+            blobs.append((int(np.median(hsv[..., 0][pixels])), pixels))
+
+        back = self._closest_blob(blobs, LM_BACK_HUE)
+        front = self._closest_blob(blobs, LM_FRONT_HUE)
+
+        if back is None or front is None or back is front:
+            return None
+
+        return self._median_colour(board, back), self._median_colour(board, front)
+
+    def _order_corners(self, corners: npt.NDArray) -> npt.NDArray[np.float32]:
+        """Orders corners as top-left, top-right, bottom-right, bottom-left."""
+
+        sums = corners.sum(axis=1)
+        diffs = corners[:, 0] - corners[:, 1]
+
+        return corners[[sums.argmin(), diffs.argmax(), sums.argmax(), diffs.argmin()]]
+
+    def _landmark_area(self, diameter: float) -> float:
+        """The nominal area of a landmark on the corrected board, in pixels."""
+
+        return np.pi * (diameter * PIXELS_PER_CM / 2) ** 2
+
+    def _closest_blob(self, blobs: list, hue: int) -> npt.NDArray | None:
+        """Returns the pixels of the blob closest to a hue, within tolerance."""
+
+        best = None
+        best_distance = LANDMARK_HUE_TOLERANCE
+
+        for blob_hue, pixels in blobs:
+            # Hue is circular, from 0 to 180
+            distance = min(abs(blob_hue - hue), 180 - abs(blob_hue - hue))
+
+            if distance <= best_distance:
+                best, best_distance = pixels, distance
+
+        return best
+
+    def _median_colour(self, image: Image, pixels: npt.NDArray) -> Colour:
+        return tuple(int(c) for c in np.median(image[pixels], axis=0))  # type: ignore
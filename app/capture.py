@@ -0,0 +1,163 @@
+from collections import deque
+from dataclasses import dataclass
+from threading import Condition, Thread
+from time import monotonic, sleep
+from typing import TYPE_CHECKING
+
+import cv2
+
+from app.config import CAPTURE_RATE_WINDOW
+from app.utils.console import *
+
+if TYPE_CHECKING:
+    from app.recording import Recorder
+
+Image = cv2.Mat
+
+CAPTURE_READ_TIMEOUT = 1.0  # maximum time to wait for a frame when blocking
+CAPTURE_RETRY_DELAY = 0.1  # delay before retrying a failed camera read
+
+
+@dataclass
+class Frame:
+    """A captured camera frame."""
+
+    image: Image
+    timestamp: float  # monotonic time at which the frame was read
+    index: int  # frame counter, starting at 1
+
+
+class FrameBuffer:
+    """
+    A single slot buffer holding the newest frame, shared between a producer
+    thread and its consumers. Consumers always receive the newest frame,
+    stale frames are overwritten and counted as dropped.
+    """
+
+    def __init__(self):
+        self.captured = 0
+        self.dropped = 0
+
+        self._frame: Frame | None = None
+        self._taken = True
+        self._condition = Condition()
+        self._timestamps = deque[float](maxlen=CAPTURE_RATE_WINDOW)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+    @property
+    def rate(self) -> float:
+        """The capture rate in frames per second, over a rolling window."""
+
+        with self._condition:
+            if len(self._timestamps) < 2:
+                return 0.0
+
+            elapsed = self._timestamps[-1] - self._timestamps[0]
+            return (len(self._timestamps) - 1) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def taken(self) -> bool:
+        """Whether the newest frame has been taken by a consumer."""
+
+        with self._condition:
+            return self._taken
+
+    def latest(self, after: int = 0) -> Frame | None:
+        """
+        Returns the newest frame without blocking, or None if no frame more
+        recent than the frame index `after` has been captured.
+        """
+
+        with self._condition:
+            if self._frame is None or self._frame.index <= after:
+                return None
+
+            self._taken = True
+            return self._frame
+
+    def read(self, timeout: float = CAPTURE_READ_TIMEOUT) -> Frame | None:
+        """Blocks until a new frame has been captured and returns it."""
+
+        with self._condition:
+            self._condition.wait_for(lambda: not self._taken, timeout)
+
+            if self._taken:
+                return None
+
+            self._taken = True
+            return self._frame
+
+    def publish(self, image: Image, timestamp: float | None = None) -> Frame:
+        """Replaces the buffered frame with a new frame."""
+
+        with self._condition:
+            if not self._taken:
+                self.dropped += 1
+
+            self.captured += 1
+            timestamp = monotonic() if timestamp is None else timestamp
+            self._frame = Frame(image, timestamp, self.captured)
+            self._taken = False
+            self._timestamps.append(timestamp)
+            self._condition.notify_all()
+
+            return self._frame
+
+
+class Capture(FrameBuffer):
+    """
+    Reads camera frames continuously on a background thread into a single
+    slot buffer, instead of letting stale frames queue up in the driver.
+    Frames are also written to the recorder, if one is given.
+    """
+
+    def __init__(self, source: int, recorder: "Recorder | None" = None):
+        super().__init__()
+
+        self.source = source
+        self.recorder = recorder
+
+        self._running = False
+        self._thread = None
+
+    def __enter__(self):
+        self.camera = cv2.VideoCapture(self.source, cv2.CAP_DSHOW)
+
+        if not self.camera.isOpened():
+            raise RuntimeError("Could not open capture source!")
+
+        # Ask the driver not to buffer frames, we only ever want the latest
+        self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self._running = True
+        self._thread = Thread(target=self._run, name="Capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._running = False
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.camera.release()
+
+    def _run(self):
+        while self._running:
+            ret, image = self.camera.read()
+
+            if not ret:
+                debug("\\[capture] Could not read frame from camera")
+                sleep(CAPTURE_RETRY_DELAY)
+                continue
+
+            frame = self.publish(image)
+
+            if self.recorder is not None:
+                self.recorder.frame(frame)
@@ -2,30 +2,74 @@
 DEBUG = False
 LOG_LEVEL = 6
 RAISE_DEPRECATION_WARNINGS = False
-POOL_SIZE = 4
+POOL_SIZE = 4  # number of worker processes for Python-heavy work
+THREAD_POOL_SIZE = 4  # number of worker threads for GIL-releasing work
 SUBDIVISIONS = 64
 
 
 # tdmclient
-PROCESS_MSG_INTERVAL = 0.1  # time interval between checks if incoming messages
+PROCESS_MSG_INTERVAL = 0.1  # fallback polling interval if packets cannot be awaited
+PUMP_LOG_INTERVAL = 5.0  # time interval between message latency reports
+PUMP_MAX_RESTARTS = 5  # consecutive failures before giving up on the driver
+PUMP_RESTART_DELAY = 1.0  # delay before restarting a failed message pump
+EVENT_QUEUE_SIZE = 4  # maximum number of pending variable events per module
 
 PHYSICAL_SIZE_CM = 110  # physical size of the scene board in cm
 THYMIO_TO_CM = 4 / 100  # factor to put the thymio speed in centimetres per seconds
 DIAMETER = 9.5  # wheel to wheel distance
 
 # == Big Brain == #
-UPDATE_FREQUENCY = 0.2  # frequency of big brain internal loop refresh
+UPDATE_FREQUENCY = 0.2  # maximum interval between big brain loop refreshes
+MODULE_STATS_INTERVAL = 1.0  # time interval between module statistics updates
+STAGE_TIMING_WINDOW = 100  # number of samples kept per timed processing stage
+
+# == Control Server == #
+ARRAY_HISTORY = 16  # number of array field deltas kept for clients to catch up
+ARRAY_DELTA_MAX_FRACTION = 0.25  # changed fraction above which arrays are resent
+PATCH_RATE = 20  # maximum patches sent to each client per second (Hz)
+PATCH_BUFFER_LIMIT = 64 * 1024  # unsent bytes above which a client is congested
 
 # == Vision == #
 USE_EXTERNAL_CAMERA = True  # use external camera or webcam
 USE_LIVE_CAMERA = True  # use camera or only fix image
+CAPTURE_RATE_WINDOW = 30  # number of frames used to estimate the capture rate
+VISION_TIMINGS = True  # time each stage of the vision pipeline
+VISION_TIMINGS_LOG_INTERVAL = 5.0  # time interval between vision timing reports
+USE_VISION_PIPELINE = False  # process frames in a multi-process staged pipeline
+PIPELINE_SLOTS = 4  # number of shared memory buffers between pipeline stages
+PIPELINE_RECTIFY_WORKERS = 1  # processes correcting the perspective of frames
+PIPELINE_SEGMENT_WORKERS = 2  # processes locating landmarks and obstacles
 
 SCENE_THRESHOLD = 10  # number of obstacles changes to trigger a scene update
+OBSTACLE_CONFIDENCE = 3  # consecutive observations for an obstacle cell to flip
+OBSTACLE_HISTORY = 64  # number of obstacle map deltas kept for consumers to catch up
+USE_OBSTACLE_GATE = True  # skip obstacle extraction when the scene is static
+OBSTACLE_GATE_THRESHOLD = 10  # grey level difference for the scene to have changed
+OBSTACLE_GATE_ROBOT_RADIUS = 8  # radius in cm around the robot ignored by the gate
+OBSTACLE_REFRESH_FRAMES = 15  # maximum number of frames between obstacle extractions
+DENOISE_STRATEGY = "bilateral"  # bilateral, gaussian, median, box or none
+OBSTACLE_POLYGON_TOLERANCE = 2  # maximum obstacle outline simplification error in cm
 PIXELS_PER_CM = 5  # number of pixels in each cm
+OBSTACLE_SUPERSAMPLING = 2  # obstacle processing pixels per planning grid cell
 TABLE_LEN = 58  # size in cm of the table
 LM_FRONT = 2.7  # diameter of the front landmark in cm
 LM_BACK = 2.3  # diameter of the back landmark in cm
 SAFE_DISTANCE = 15  # distance from the hole of the robot until the further point in cm
+CAMERA_MATRIX = None  # 3x3 camera intrinsics matrix, if the lens is calibrated
+DISTORTION_COEFFICIENTS = None  # lens distortion coefficients (k1, k2, p1, p2, k3)
+USE_TRACKING = True  # search landmarks around their predicted position only
+TRACKING_MARGIN = 3  # margin around the predicted landmark position in cm
+TRACKING_SIGMAS = 3  # number of EKF standard deviations added to the margin
+TRACKING_MAX_MISSES = 3  # consecutive misses before searching the full image
+USE_AUTO_CALIBRATION = True  # find the board and landmarks instead of using the GUI
+AUTO_CALIBRATION_FRAMES = 5  # number of frames used by the automatic calibration
+CALIBRATION_CHECK_INTERVAL = 5.0  # time interval between board position checks
+CALIBRATION_MOVE_THRESHOLD = 4  # board corner displacement in pixels to recalibrate
+LM_BACK_HUE = 168  # nominal hue of the back landmark (pink), from 0 to 180
+LM_FRONT_HUE = 115  # nominal hue of the front landmark (blue), from 0 to 180
+
+# == Batch == #
+BATCH_CHUNK_SIZE = 16  # frames processed by a pool process at a time
 
 # == Second Thymio == #
 DROP_SPEED = 50  # speed of the motors to drop the bauble
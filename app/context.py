@@ -1,11 +1,18 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 from tdmclient import ClientAsyncCacheNode
 
-from app.utils.pool import Pool
 from app.state import State
+from app.utils.dispatcher import Dispatcher
+from app.utils.obstacle_tracker import ObstacleTracker
+from app.utils.pool import Pool
 from app.utils.types import Signal
 
+if TYPE_CHECKING:
+    from app.recording import Recorder, Replay
+
 
 @dataclass
 class Context:
@@ -21,3 +28,8 @@ class Context:
     scene_update: Signal = Signal()
     pose_update: Signal = Signal()
     debug_update: bool = False
+    events: Dispatcher = field(default_factory=Dispatcher)
+    obstacles: ObstacleTracker = field(default_factory=ObstacleTracker)
+    recorder: "Recorder | None" = None
+    replay: "Replay | None" = None
+    calibration: Path | None = None  # vision calibration file
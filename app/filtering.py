@@ -11,6 +11,8 @@ from app.utils.types import Channel, Vec2
 
 class Filtering(Module):
 
+    variables = frozenset(["motor.left.speed", "motor.right.speed"])
+
     def __init__(self, ctx: Context, rx_pos: Channel[Vec2] | None = None):
         super().__init__(ctx)
 
@@ -67,6 +69,7 @@ class Filtering(Module):
 
         self.ctx.state.position = (pose_x_est, pose_y_est)
         self.ctx.state.orientation = orientation_est
+        self.ctx.state.position_uncertainty = self.position_uncertainty()
 
         self.last_update = now
 
@@ -85,3 +88,9 @@ class Filtering(Module):
 
         self.ctx.state.position = (float(pose_x_est), float(pose_y_est))
         self.ctx.state.orientation = float(orientation_est)
+        self.ctx.state.position_uncertainty = self.position_uncertainty()
+
+    def position_uncertainty(self) -> float:
+        """Returns the largest standard deviation of the position estimate in cm"""
+
+        return math.sqrt(max(self.ekf.P[0, 0], self.ekf.P[1, 1]))
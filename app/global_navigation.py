@@ -15,6 +15,8 @@ from app.state import ObstacleQuad
 from app.utils.console import *
 from app.utils.math import clamp
 from app.utils.module import Module
+from app.utils.array_history import ArrayDelta
+from app.utils.pool import Executor, task
 from app.utils.types import Vec2
 
 
@@ -31,6 +33,14 @@ class GlobalNavigation(Module):
         self.algorithm = algorithm
         self.computedOnce = False
 
+        # The composited map, kept up to date with the obstacle changes
+        self._version = -1
+        self._extra: list[ObstacleQuad] | None = None
+        self._extra_mask = None
+        self._merged = None
+        self._margin = None
+        self._kernel = None
+
     async def run(self):
         while True:
             await self.ctx.scene_update.wait()
@@ -39,7 +49,8 @@ class GlobalNavigation(Module):
     async def _recompute_path(self):
         """
         Recomputes path, saving it to the state. This function offloads
-        work to the pool to avoid blocking the GIL.
+        the map convolution to a thread and the search to a process, avoiding
+        blocking the event loop and the GIL.
         """
 
         # Extract useful variables from the state
@@ -50,8 +61,27 @@ class GlobalNavigation(Module):
         if not start or not end or obstacles is None:
             return False
 
-        # Generate the map from known obstacles
-        map = self._generate_map()
+        # Read the obstacle changes on the event loop, where the tracker lives
+        tracker = self.ctx.obstacles
+        extra = list(self.ctx.state.extra_obstacles)
+        changes = None
+
+        if obstacles is tracker.map:
+            if extra == self._extra:
+                changes = tracker.changes_since(self._version)
+
+            snapshot = tracker.map.copy() if changes is None else None
+            self._version = tracker.version
+
+        else:
+            # Obstacles set on the state directly (e.g. the report) have no history
+            snapshot = obstacles.copy()
+            self._version = -1
+
+        # Generate the map from known obstacles (SciPy releases the GIL)
+        map = await self.ctx.pool.run_thread(
+            self._generate_map, snapshot, changes, extra
+        )
 
         # Save the map to the state, sending it to the Web UI
         self.ctx.state.boundary_map = map
@@ -85,29 +115,83 @@ class GlobalNavigation(Module):
 
         return True
 
-    def _generate_map(self) -> Map:
+    def _generate_map(
+        self,
+        snapshot: Map | None,
+        changes: ArrayDelta | None,
+        extra: list[ObstacleQuad],
+    ) -> Map:
         """
         Generates a map of obstacles that is passed to the graph to
         determine which nodes can be visited. The obstacles and extra_obstaclse
         are merged together, and a safety margin is added around the obstacles.
+
+        The map is composited from scratch given a snapshot of the obstacle
+        map, otherwise only the changed obstacle cells are applied to it.
         """
 
-        map = np.array(self.ctx.state.obstacles, dtype=np.int8)
+        if snapshot is not None:
+            self._composite(snapshot, extra)
+
+        elif changes is not None:
+            self._apply_changes(changes)
+
+        assert self._margin is not None
+        return (self._margin > 0).astype(np.int8)
+
+    def _composite(self, obstacles: Map, extra: list[ObstacleQuad]):
+        """Merges the obstacles and extra obstacles, adding a safety margin."""
+
+        self._extra = extra
+        self._extra_mask = np.zeros(obstacles.shape, dtype=bool)
 
-        for obstacle in self.ctx.state.extra_obstacles:
+        for obstacle in extra:
             (x1, y1), (x2, y2) = self._obstacle_to_location(obstacle)
-            map[y1:y2, x1:x2] = 1
+            self._extra_mask[y1:y2, x1:x2] = True
+
+        self._merged = ((obstacles != 0) | self._extra_mask).astype(np.int16)
+        self._margin = self._with_safety_margin(self._merged)
+
+    def _apply_changes(self, changes: ArrayDelta):
+        """
+        Applies changed obstacle cells to the composited map, adding or
+        removing the safety margin kernel around each cell that flipped.
+        """
+
+        assert self._merged is not None and self._margin is not None
+        assert self._extra_mask is not None and self._kernel is not None
+
+        kernel = self._kernel
+        size = len(kernel)
+        offset = (size - 1) // 2  # the kernel origin used by `convolve2d`
+        rows, cols = self._merged.shape
+
+        for (row, col), value in zip(changes.cells, changes.values):
+            merged = int(value != 0 or self._extra_mask[row, col])
+            diff = merged - self._merged[row, col]
+
+            if diff == 0:
+                continue
+
+            self._merged[row, col] = merged
+
+            # The window of cells whose margin includes this cell
+            r0, c0 = row - offset, col - offset
+            r1, c1 = max(r0, 0), max(c0, 0)
+            r2, c2 = min(r0 + size, rows), min(c0 + size, cols)
 
-        return self._with_safety_margin(map)
+            window = kernel[r1 - r0 : r2 - r0, c1 - c0 : c2 - c0]
+            self._margin[r1:r2, c1:c2] += diff * window
 
     def _with_safety_margin(self, map: Map) -> Map:
         """
         Applies a convolution kernel to the map to add a safety margin
-        that the robot should also consider as unvisitable.
+        that the robot should also consider as unvisitable. Returns the
+        number of obstacle cells within the safety distance of each cell.
         """
 
-        kernel = self._safety_margin_kernel()
-        return convolve2d(map, kernel, mode="same", boundary="fill")
+        self._kernel = self._safety_margin_kernel().astype(np.int16)
+        return convolve2d(map, self._kernel, mode="same", boundary="fill")
 
     def _safety_margin_kernel(self) -> NDArray[int8]:
         """Generate a circular kernel of an adequate size."""
@@ -158,6 +242,7 @@ class GlobalNavigation(Module):
         return (i + offset) * factor, (j + offset) * factor
 
 
+@task(Executor.Process)
 def profile_algo(
     start: Location, end: Location, algo: Algorithm
 ) -> tuple[list[Location] | None, float]:
@@ -80,6 +80,8 @@ SensorsValuesBack = np.array(
 class LocalNavigation(Module):
     """Module that is tasked with reactive obstacle avoidance."""
 
+    variables = frozenset(["prox.horizontal"])
+
     def __init__(self, ctx: Context, motion_control: MotionControl):
         super().__init__(ctx)
         self.motion_control = motion_control
@@ -0,0 +1,128 @@
+import json
+from typing import Any
+
+import numpy as np
+
+from app.state import make_serialisable
+
+JSON_PROTOCOL = "json"  # every message is a JSON text frame
+BINARY_PROTOCOL = "binary.v1"  # messages are binary frames with typed arrays
+PROTOCOLS = (BINARY_PROTOCOL, JSON_PROTOCOL)  # offered to clients, preferred first
+
+ALIGNMENT = 8  # byte alignment of arrays, so that clients can view them in place
+
+# Array types that clients can view as typed arrays, others are converted
+ARRAY_DTYPES = (
+    "int8",
+    "uint8",
+    "int16",
+    "uint16",
+    "int32",
+    "uint32",
+    "float32",
+    "float64",
+)
+
+
+def encode(type: str, data: Any, binary: bool) -> str | bytes:
+    """Encodes a message with the protocol chosen by the client."""
+
+    return encode_binary(type, data) if binary else encode_json(type, data)
+
+
+def encode_json(type: str, data: Any) -> str:
+    """Encodes a message as JSON, with arrays as nested lists."""
+
+    if isinstance(data, dict):
+        data = {key: make_serialisable(value) for key, value in data.items()}
+
+    return json.dumps({"type": type, "data": data})
+
+
+def encode_binary(type: str, data: Any) -> bytes:
+    """
+    Encodes a message as a binary frame. Top-level arrays of a data object
+    are sent as raw bytes after a JSON header, other values stay in the
+    header. Arrays of zeros and ones are packed to one bit per value.
+
+    The frame is laid out as:
+
+    - the header length, as a little-endian uint32
+    - the JSON header `{"type", "data", "arrays"}`, padded with spaces
+    - the arrays, each aligned to `ALIGNMENT` bytes
+
+    Each array is described by `{"key", "dtype", "shape", "bits", "offset",
+    "length"}` in the header, with an offset from the end of the header.
+    """
+
+    arrays = []
+    buffers = []
+    offset = 0
+
+    if isinstance(data, dict):
+        fields = {}
+
+        for key, value in data.items():
+            if not isinstance(value, np.ndarray) or value.size == 0:
+                fields[key] = make_serialisable(value)
+                continue
+
+            value = _viewable(value)
+            bits = _is_binary(value)
+            buffer = np.packbits(value != 0).tobytes() if bits else value.tobytes()
+
+            arrays.append(
+                {
+                    "key": key,
+                    "dtype": str(value.dtype),
+                    "shape": value.shape,
+                    "bits": bits,
+                    "offset": offset,
+                    "length": len(buffer),
+                }
+            )
+
+            buffers.append(buffer + _padding(len(buffer)))
+            offset += len(buffers[-1])
+
+        data = fields
+
+    header = json.dumps({"type": type, "data": data, "arrays": arrays}).encode()
+    header += b" " * _padding_length(4 + len(header))
+
+    return b"".join([len(header).to_bytes(4, "little"), header, *buffers])
+
+
+def _viewable(array: np.ndarray) -> np.ndarray:
+    """Converts an array to a type that clients can view as a typed array."""
+
+    if array.dtype.name in ARRAY_DTYPES:
+        return np.ascontiguousarray(array)
+
+    if array.dtype == np.bool_:
+        return array.astype(np.uint8)
+
+    if np.issubdtype(array.dtype, np.integer):
+        limits = np.iinfo(np.int32)
+
+        if array.min() >= limits.min and array.max() <= limits.max:
+            return array.astype(np.int32)
+
+    return array.astype(np.float64)
+
+
+def _is_binary(array: np.ndarray) -> bool:
+    """Whether an integer array only holds zeros and ones."""
+
+    if not np.issubdtype(array.dtype, np.integer):
+        return False
+
+    return bool(array.min() >= 0 and array.max() <= 1)
+
+
+def _padding_length(length: int) -> int:
+    return -length % ALIGNMENT
+
+
+def _padding(length: int) -> bytes:
+    return b"\0" * _padding_length(length)
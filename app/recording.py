@@ -0,0 +1,257 @@
+import json
+from asyncio import Event, sleep
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Any
+
+import numpy as np
+
+from app.capture import Frame, FrameBuffer
+from app.context import Context
+from app.utils.console import *
+from app.utils.dispatcher import Dispatcher
+from app.utils.types import Channel, Vec2
+
+SESSION_VERSION = 1
+SESSION_FILE = "session.json"  # session metadata, written when recording ends
+FRAMES_FILE = "frames.raw"  # raw BGR frames, back to back
+TIMELINE_FILE = "timeline.jsonl"  # one timestamped event per line
+
+REPLAY_POLL_INTERVAL = 0.001  # interval between checks if a frame was processed
+
+
+class Recorder:
+    """
+    Records a session to a directory: raw camera frames are appended to a
+    single file that can be memory-mapped on replay, and every frame, Thymio
+    variable event and control command is written to a timeline.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self.frame_shape: tuple[int, ...] | None = None
+        self.frames = 0
+
+        self._lock = Lock()
+        self._start = monotonic()
+        self._events: Dispatcher | None = None
+        self._node = None
+
+    def __enter__(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._frames = (self.path / FRAMES_FILE).open("wb")
+        self._timeline = (self.path / TIMELINE_FILE).open("w")
+        self._start = monotonic()
+        return self
+
+    def __exit__(self, *_):
+        if self._node is not None:
+            self._node.remove_variables_changed_listener(self._on_variables_changed)
+            self._node = None
+
+        with self._lock:
+            self._frames.close()
+            self._timeline.close()
+
+        session = {
+            "version": SESSION_VERSION,
+            "frame_shape": self.frame_shape,
+            "frames": self.frames,
+        }
+
+        with (self.path / SESSION_FILE).open("w") as file:
+            json.dump(session, file)
+
+        info(f"Recorded {self.frames} frames to {self.path}")
+
+    def attach(self, node, events: Dispatcher):
+        """Records the changes of the variables that are subscribed to."""
+
+        self._events = events
+        self._node = node
+        node.add_variables_changed_listener(self._on_variables_changed)
+
+    def frame(self, frame: Frame):
+        """Records a camera frame, called from the capture thread."""
+
+        image = frame.image
+
+        with self._lock:
+            if self._frames.closed:
+                return
+
+            if self.frame_shape is None:
+                self.frame_shape = image.shape
+
+            if image.shape != self.frame_shape:
+                warning(f"\\[recorder] Skipping frame of shape {image.shape}")
+                return
+
+            self._frames.write(np.ascontiguousarray(image).tobytes())
+            self.frames += 1
+            self._write(frame.timestamp, "frame", self.frames)
+
+    def variables(self, variables: dict[str, Any]):
+        """Records a Thymio variable event."""
+
+        with self._lock:
+            self._write(monotonic(), "variables", variables)
+
+    def command(self, command: Any):
+        """Records a command received from a control client."""
+
+        with self._lock:
+            self._write(monotonic(), "command", command)
+
+    def _write(self, timestamp: float, type: str, data: Any):
+        if self._timeline.closed:
+            return
+
+        event = {"t": timestamp - self._start, "type": type, "data": data}
+        self._timeline.write(json.dumps(event) + "\n")
+
+    def _on_variables_changed(self, _, variables: dict[str, Any]):
+        if self._events is None:
+            return
+
+        subscribed = {
+            name: list(value)
+            for name, value in variables.items()
+            if self._events.subscribed(name)
+        }
+
+        if subscribed:
+            self.variables(subscribed)
+
+
+class ReplayNode:
+    """
+    Stands in for the Thymio node when replaying a session. Variable events
+    are dispatched by the replay itself, and motor commands are discarded.
+    """
+
+    def __init__(self):
+        self.watching = Event()
+        self.targets: dict[str, Any] = {}
+
+    def add_variables_changed_listener(self, _):
+        pass
+
+    def remove_variables_changed_listener(self, _):
+        pass
+
+    async def watch(self, **_):
+        self.watching.set()
+
+    async def set_variables(self, variables: dict[str, Any]):
+        self.targets.update(variables)
+
+    def send_set_variables(self, variables: dict[str, Any]):
+        self.targets.update(variables)
+
+
+class Replay:
+    """
+    Replays a recorded session through the application, without a camera or
+    a Thymio. Frames are fed to `Vision` through `frames`, variable events to
+    the modules and commands to the control server handler.
+
+    In real time, events are spaced as they were recorded. Otherwise, events
+    are replayed as fast as possible, each frame waiting for the previous one
+    to be processed so that none are dropped. Recorded stop commands are
+    skipped, the application is stopped once the timeline has been replayed.
+    """
+
+    def __init__(self, path: Path | str, realtime=True):
+        self.path = Path(path)
+        self.realtime = realtime
+
+        self.node = ReplayNode()
+        self.frames = FrameBuffer()
+
+    def __enter__(self):
+        self.images = session_frames(self.path)
+
+        with (self.path / TIMELINE_FILE).open() as file:
+            self.timeline = [json.loads(line) for line in file]
+
+        if self.images is not None:
+            # Provide a frame for calibration before the replay starts
+            self.frames.publish(self.images[0])
+
+        info(f"Replaying {len(self.timeline)} events from {self.path}")
+        return self
+
+    def __exit__(self, *_):
+        self.images = None
+
+    async def run(self, ctx: Context, tx_pos: Channel[Vec2]):
+        """Replays the timeline, once the modules are watching for events."""
+
+        # Avoid a circular import, the server depends on the context
+        from app.server import handle_message
+
+        await self.node.watching.wait()
+
+        start = monotonic()
+        origin = self.timeline[0]["t"] if self.timeline else 0.0
+
+        for event in self.timeline:
+            if self.realtime:
+                delay = (event["t"] - origin) - (monotonic() - start)
+
+                if delay > 0:
+                    await sleep(delay)
+
+            else:
+                await sleep(0)
+
+            match event["type"]:
+                case "frame":
+                    await self._publish(event["data"])
+
+                case "variables":
+                    ctx.events.dispatch(event["data"])
+
+                case "command":
+                    # Stopping would exit the application partway through
+                    if event["data"]["type"] == "stop":
+                        debug("\\[replay] Skipping recorded stop command")
+                        continue
+
+                    await handle_message(event["data"], None, ctx, tx_pos)
+
+        info("Replay finished")
+
+    async def _publish(self, index: int):
+        """Publishes a recorded frame, given its 1-based index."""
+
+        assert self.images is not None
+
+        if not self.realtime:
+            while not self.frames.taken:
+                await sleep(REPLAY_POLL_INTERVAL)
+
+        self.frames.publish(np.asarray(self.images[index - 1]))
+
+
+def session_frames(path: Path | str) -> np.memmap | None:
+    """
+    Memory-maps the frames of a recorded session, as an array of shape
+    (frames, height, width, channels). Returns None if no frame was recorded.
+    """
+
+    path = Path(path)
+
+    with (path / SESSION_FILE).open() as file:
+        session = json.load(file)
+
+    if session["version"] != SESSION_VERSION:
+        raise RuntimeError(f"Unsupported session version {session['version']}")
+
+    if session["frames"] == 0:
+        return None
+
+    shape = (session["frames"], *session["frame_shape"])
+    return np.memmap(path / FRAMES_FILE, dtype=np.uint8, mode="r", shape=shape)
@@ -5,8 +5,10 @@ from typing import Any
 from aiohttp import WSMsgType
 from aiohttp.web import Application, AppRunner, Request, TCPSite, WebSocketResponse, get
 
+from app.broadcast import Broadcast
 from app.context import Context
-from app.state import ChangeListener, normalise_obstacle
+from app.protocol import BINARY_PROTOCOL, PROTOCOLS, encode
+from app.state import normalise_obstacle
 from app.utils.console import *
 from app.utils.types import Channel, Vec2
 
@@ -21,9 +23,12 @@ class Server:
         self.site = None
         self.ctx = ctx
         self.tx_pos = tx_pos
+        self.broadcast = Broadcast(ctx.state)
 
     async def __aenter__(self, host="127.0.0.1", port=8080):
-        app = create_app(self.ctx, self.tx_pos)
+        self.broadcast.__enter__()
+
+        app = create_app(self.ctx, self.tx_pos, self.broadcast)
         runner = AppRunner(app)
         await runner.setup()
 
@@ -37,28 +42,35 @@ class Server:
             await self.site.stop()
             self.site = None
 
+        self.broadcast.__exit__()
+
 
 async def websocket_handler(request: Request):
     """Handle a new client connection over WebSocket."""
 
     ctx: Context = request.app["ctx"]
     tx_pos: Channel[Vec2] = request.app["tx_pos"]
+    broadcast: Broadcast = request.app["broadcast"]
 
-    ws = WebSocketResponse()
+    ws = WebSocketResponse(protocols=PROTOCOLS)
     await ws.prepare(request)
 
-    debug("\\[server] Client connected")
+    # Clients that do not negotiate a protocol receive JSON
+    binary = ws.ws_protocol == BINARY_PROTOCOL
 
-    try:
-        listener = ctx.state.register_listener()
+    debug(f"\\[server] Client connected ({ws.ws_protocol or 'json'})")
+
+    # Patches continue from the state sent, so subscribe without yielding
+    state = ctx.state.json(serialise=False)
+    subscriber = broadcast.subscribe(ws, binary, request.transport)
 
-        await ws.send_json({"type": "msg", "data": "Hi!"})
-        await ws.send_json({"type": "state", "data": ctx.state.json()})
+    try:
+        await send(ws, binary, "msg", "Hi!")
+        await send(ws, binary, "state", state)
 
-        tx = create_task(handle_tx(ws, listener))
+        subscriber.start()
         await handle_rx(ws, ctx, tx_pos)
 
-        tx.cancel()
         debug("\\[server] Client disconnected")
 
     except ConnectionResetError:
@@ -74,23 +86,21 @@ async def websocket_handler(request: Request):
         if ctx.state.prox_sensors:
             print("type of prox_sensors", type(ctx.state.prox_sensors[0]))
 
+    finally:
+        broadcast.unsubscribe(subscriber)
+
     return ws
 
 
-async def handle_tx(ws: WebSocketResponse, listener: ChangeListener):
-    """Send state patches to the client."""
+async def send(ws: WebSocketResponse, binary: bool, type: str, data: Any):
+    """Sends a message to the client, encoded with its protocol."""
 
-    try:
-        while True:
-            await listener.wait_for_patch()
-            await ws.send_json({"type": "patch", "data": listener.get_patch()})
+    message = encode(type, data, binary)
 
-    except ConnectionResetError:
-        pass
-
-    except Exception:
-        error("\\[server] Error sending patch!")
-        print_exc()
+    if isinstance(message, bytes):
+        await ws.send_bytes(message)
+    else:
+        await ws.send_str(message)
 
 
 async def handle_rx(ws: WebSocketResponse, ctx: Context, tx_pos: Channel[Vec2]):
@@ -102,14 +112,21 @@ async def handle_rx(ws: WebSocketResponse, ctx: Context, tx_pos: Channel[Vec2]):
 
 
 async def handle_message(
-    msg: Any, ws: WebSocketResponse, ctx: Context, tx_pos: Channel[Vec2]
+    msg: Any, ws: WebSocketResponse | None, ctx: Context, tx_pos: Channel[Vec2]
 ):
-    """Handle a single message from the client."""
+    """
+    Handle a single message from the client. Replayed messages have no
+    client to reply to.
+    """
+
+    if ctx.recorder is not None and msg["type"] != "ping":
+        ctx.recorder.command(msg)
 
     match msg["type"]:
         case "ping":
-            id = msg["data"]
-            await ws.send_json({"type": "pong", "data": id})
+            if ws is not None:
+                id = msg["data"]
+                await send(ws, ws.ws_protocol == BINARY_PROTOCOL, "pong", id)
 
         case "set_position":
             tx_pos.send(msg["data"])
@@ -156,12 +173,13 @@ def stop_all(ctx: Context):
     exit()
 
 
-def create_app(ctx: Context, tx_pos: Channel[Vec2]):
+def create_app(ctx: Context, tx_pos: Channel[Vec2], broadcast: Broadcast):
     """Create the control server HTTP/WS application."""
 
     app = Application()
     app["ctx"] = ctx
     app["tx_pos"] = tx_pos
+    app["broadcast"] = broadcast
 
     app.add_routes([get("/ws", websocket_handler)])
     return app
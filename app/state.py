@@ -4,28 +4,82 @@ from typing import Any
 import numpy as np
 import numpy.typing as npt
 
-from app.config import PHYSICAL_SIZE_CM, SUBDIVISIONS
+from app.config import (
+    ARRAY_DELTA_MAX_FRACTION,
+    ARRAY_HISTORY,
+    PHYSICAL_SIZE_CM,
+    SUBDIVISIONS,
+)
 from app.path_finding.types import Location, Map
+from app.utils.array_history import ArrayDelta, ArrayHistory
 from app.utils.types import Signal, Vec2
 
 ObstacleQuad = tuple[Vec2, Vec2]
+ObstaclePolygon = list[Vec2]
 
 
-OMITTED_KEYS = ["_dirty", "_changes"]
+OMITTED_KEYS = ["_dirty", "_changes", "_arrays"]
+
+# Map fields that patches may update with only their changed cells, the UI
+# applies deltas to these fields only (see `ARRAY_KEYS` in connection.ts)
+ARRAY_KEYS = ["obstacles", "boundary_map"]
 
 
 class ChangeListener:
+    """
+    Collects the changes to the state, until they are taken as a patch.
+
+    Array fields are versioned: patches only carry the cells that changed
+    since the version the listener last received, as an `ArrayDelta`, unless
+    the history does not go back that far or most of the array changed.
+    """
+
     def __init__(self, state: "State"):
         self._state = state
         self._changes = {}
 
-    def get_patch(self) -> dict[str, Any]:
-        patch = {key: make_serialisable(value) for key, value in self._changes.items()}
+        # Array versions received so far, changes start from registration
+        self._versions = {
+            key: history.version for key, history in state._arrays.items()
+        }
+
+    def get_patch(self, serialise=True) -> dict[str, Any]:
+        """
+        Returns the changes since the last patch. Unless `serialise` is unset,
+        values are converted to JSON-serialisable types.
+        """
+
+        patch = {}
+
+        for key, value in self._changes.items():
+            history = self._state._arrays.get(key)
+
+            if history is not None:
+                value = self._array_patch(key, history)
+
+                if isinstance(value, ArrayDelta) and len(value) == 0:
+                    continue
+
+            patch[key] = make_serialisable(value) if serialise else value
 
         self._changes = {}
         return patch
 
+    def _array_patch(self, key: str, history: ArrayHistory) -> Any:
+        """Returns the changed cells of an array field, or its whole value."""
+
+        delta = None
+
+        if key in self._versions:
+            delta = history.changes_since(self._versions[key])
+
+        self._versions[key] = history.version
+        return delta if delta is not None else history.value
+
     def _add_change(self, key: str, value: Any):
+        if key in self._changes:
+            value = merge_change(self._changes[key], value)
+
         self._changes[key] = value
 
     async def wait_for_patch(self):
@@ -45,10 +99,12 @@ class State:
 
     _dirty = Signal()
     _changes: list[ChangeListener] = field(default_factory=list)
+    _arrays: dict[str, ArrayHistory] = field(default_factory=dict)
 
     # == Filtering == #
     position: Vec2 | None = None
     orientation: float | None = None
+    position_uncertainty: float | None = None
 
     # == Navigation == #
     end: Vec2 | None = None
@@ -57,7 +113,11 @@ class State:
     # == Global Navigation == #
     path: list[Vec2] | None = None
     next_waypoint_index: int | None = None
-    obstacles: npt.NDArray[np.int8] | None = None
+    obstacles: npt.NDArray[np.int8] | None = None  # updated in place, see changes
+    obstacle_changes: ArrayDelta | None = None  # latest changed obstacle cells
+    obstacles_version: int = 0
+    obstacle_polygons: list[ObstaclePolygon] = field(default_factory=list)
+    obstacle_polygons_version: int = 0  # obstacle map version they outline
     extra_obstacles: list[ObstacleQuad] = field(default_factory=list)
     boundary_map: Map | None = None
     computation_time: float | None = None
@@ -70,6 +130,12 @@ class State:
     last_detection: Vec2 | None = None
     last_detection_front: Vec2 | None = None
     last_orientation: float | None = None
+    capture_rate: float | None = None
+    dropped_frames: int = 0
+    vision_latency: float | None = None
+    obstacle_frames_processed: int = 0
+    obstacle_frames_skipped: int = 0
+    vision_timings: dict[str, dict[str, float]] = field(default_factory=dict)
 
     # == Local Navigation == #
     prox_sensors: list[float] | None = None
@@ -77,9 +143,21 @@ class State:
     reactive_control: bool | None = None
     dist: float | None = None
 
+    # == Monitoring == #
+    module_stats: dict[str, dict[str, float]] = field(default_factory=dict)
+
     # == Methods == #
 
     def __setattr__(self, name, value):
+        arrays = self.__dict__.get("_arrays")
+
+        # Array fields keep a history of their changed cells
+        if arrays is not None and name in ARRAY_KEYS:
+            if name not in arrays:
+                arrays[name] = ArrayHistory(ARRAY_HISTORY, ARRAY_DELTA_MAX_FRACTION)
+
+            arrays[name].record(value)
+
         try:
             for listener in self._changes:
                 listener._add_change(name, value)
@@ -89,9 +167,9 @@ class State:
 
         super().__setattr__(name, value)
 
-    def json(self):
+    def json(self, serialise=True):
         return {
-            key: make_serialisable(value)
+            key: make_serialisable(value) if serialise else value
             for (key, value) in self.__dict__.items()
             if key not in OMITTED_KEYS
         }
@@ -113,7 +191,26 @@ class State:
         await self._dirty.wait()
 
 
+def merge_change(previous: Any, value: Any) -> Any:
+    """
+    Combines two consecutive values of a field. Deltas not sent yet are
+    merged, or applied to the whole array, so that no change is lost.
+    """
+
+    if isinstance(value, ArrayDelta):
+        if isinstance(previous, ArrayDelta):
+            return previous.merge(value)
+
+        if isinstance(previous, np.ndarray):
+            return value.apply(previous)
+
+    return value
+
+
 def make_serialisable(value: Any):
+    if isinstance(value, ArrayDelta):
+        return value.json()
+
     return value.tolist() if isinstance(value, np.ndarray) else value
 
 
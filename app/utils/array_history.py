@@ -0,0 +1,132 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+
+@dataclass
+class ArrayDelta:
+    """The cells of an array that changed, up to a version."""
+
+    version: int
+    cells: npt.NDArray[np.intp]  # index of each changed cell, e.g. (row, column)
+    values: npt.NDArray  # new value of each changed cell
+
+    def __len__(self):
+        return len(self.values)
+
+    def merge(self, later: "ArrayDelta") -> "ArrayDelta":
+        """Combines this delta with a later one, the later values winning."""
+
+        cells = np.concatenate((self.cells, later.cells))
+        values = np.concatenate((self.values, later.values))
+
+        # Keep the last occurrence of each cell
+        _, first = np.unique(cells[::-1], axis=0, return_index=True)
+        keep = len(cells) - 1 - first
+
+        return ArrayDelta(later.version, cells[keep], values[keep])
+
+    def apply(self, array: npt.NDArray) -> npt.NDArray:
+        """Returns a copy of an array with the changed cells applied."""
+
+        array = array.copy()
+        array[tuple(self.cells.T)] = self.values
+        return array
+
+    def json(self):
+        cells = zip(self.cells.tolist(), self.values.tolist())
+        return {"version": self.version, "cells": [[*cell, v] for cell, v in cells]}
+
+
+class ArrayHistory:
+    """
+    The recent changes of an array, numbered by version, so that consumers
+    can catch up from the version they last saw with only the changed cells.
+
+    Changes are either pushed as they are made, or found by comparing each
+    new value of the array with the previous one when it is recorded.
+    """
+
+    def __init__(self, length: int, max_fraction: float = 1.0):
+        self.max_fraction = max_fraction
+        self.version = 0
+        self.value: Any = None
+
+        self._snapshot: npt.NDArray | None = None
+        self._history = deque[ArrayDelta](maxlen=length)
+
+    def push(self, cells: npt.NDArray[np.intp], values: npt.NDArray) -> ArrayDelta:
+        """Adds the cells that changed as a new version."""
+
+        self.version += 1
+        delta = ArrayDelta(self.version, cells, values)
+        self._history.append(delta)
+
+        return delta
+
+    def record(self, value: Any) -> ArrayDelta | None:
+        """
+        Records a new value of the array, as the cells that changed since the
+        previous value. Replacing it with a value of another shape or type
+        starts a new history. Returns None if no cell changed.
+        """
+
+        previous = self._snapshot
+        self.value = value
+
+        if not isinstance(value, np.ndarray):
+            self._reset(None)
+            return None
+
+        if (
+            previous is None
+            or previous.shape != value.shape
+            or previous.dtype != value.dtype
+        ):
+            self._reset(value.copy())
+            return None
+
+        changed = previous != value
+
+        if not changed.any():
+            return None
+
+        self._snapshot = value.copy()
+        return self.push(np.argwhere(changed), value[changed])
+
+    def changes_since(self, version: int) -> ArrayDelta | None:
+        """
+        Returns the cells that changed since a version, merged into a single
+        delta. Returns None if the history does not go back that far, or if
+        so many cells changed that the whole array should be read again.
+        """
+
+        if version == self.version:
+            return ArrayDelta(
+                version, np.empty((0, 2), dtype=np.intp), np.empty(0, dtype=np.int8)
+            )
+
+        if not self._history or self._history[0].version > version + 1:
+            return None
+
+        deltas = [delta for delta in self._history if delta.version > version]
+        merged = deltas[0]
+
+        for delta in deltas[1:]:
+            merged = merged.merge(delta)
+
+        if self._snapshot is not None:
+            if len(merged) > self._snapshot.size * self.max_fraction:
+                return None
+
+        return merged
+
+    def _reset(self, snapshot: npt.NDArray | None):
+        """Starts a new history, older versions can no longer be caught up."""
+
+        self.version += 1
+        self._snapshot = snapshot
+        self._history.clear()
@@ -0,0 +1,113 @@
+from time import monotonic
+from typing import Any, Callable, Iterable
+
+from tdmclient import ClientAsyncCacheNode
+
+from app.utils.console import *
+
+Variables = dict[str, Any]
+Callback = Callable[[Variables], None]
+
+
+class Subscription:
+    """A set of Thymio variables that a callback is interested in."""
+
+    def __init__(self, variables: Iterable[str], callback: Callback):
+        self.variables = frozenset(variables)
+        self.callback = callback
+
+
+class Dispatcher:
+    """
+    Routes Thymio variable changes to the subscribers that declared an
+    interest in them. A single listener is registered on the node, and each
+    change is looked up by variable name, so subscribers are only called for
+    the variables they consume.
+
+    Subscribers always receive the latest value of every variable they
+    declared, and are only called once each of them has been received.
+
+    The time at which the changes being dispatched arrived is available to
+    subscribers as `timestamp`, it is read from `clock` when changes are
+    received from a node.
+    """
+
+    def __init__(self):
+        self._subscriptions: dict[str, list[Subscription]] = {}
+        self._values: Variables = {}
+
+        self.clock: Callable[[], float] = monotonic
+        self.timestamp: float | None = None
+
+    @property
+    def variables(self) -> set[str]:
+        """The union of all subscribed variables."""
+
+        return set(self._subscriptions.keys())
+
+    def subscribed(self, name: str) -> bool:
+        """Whether a variable has been subscribed to."""
+
+        return name in self._subscriptions
+
+    def subscribe(self, variables: Iterable[str], callback: Callback):
+        subscription = Subscription(variables, callback)
+
+        for name in subscription.variables:
+            self._subscriptions.setdefault(name, []).append(subscription)
+
+    def unsubscribe(self, callback: Callback):
+        for name, subscriptions in list(self._subscriptions.items()):
+            subscriptions[:] = [s for s in subscriptions if s.callback != callback]
+
+            if not subscriptions:
+                del self._subscriptions[name]
+
+    def attach(self, node: ClientAsyncCacheNode):
+        """Start receiving variable changes from a node."""
+
+        node.add_variables_changed_listener(self._on_variables_changed)
+
+    def detach(self, node: ClientAsyncCacheNode):
+        """Stop receiving variable changes from a node."""
+
+        node.remove_variables_changed_listener(self._on_variables_changed)
+
+    async def watch(self, node: ClientAsyncCacheNode):
+        """
+        Signal the node to broadcast variable changes, if any variables have
+        been subscribed to. The Thymio device manager can only watch all
+        variables at once, filtering happens on dispatch.
+        """
+
+        if self._subscriptions:
+            debug(f"Watching variables {', '.join(sorted(self.variables))}")
+            await node.watch(variables=True)
+
+    def dispatch(self, variables: Variables, timestamp: float | None = None):
+        """Dispatch a set of changed variables to interested subscribers."""
+
+        self.timestamp = timestamp if timestamp is not None else monotonic()
+
+        # Collect affected subscriptions, preserving subscription order
+        affected: dict[int, Subscription] = {}
+
+        for name, value in variables.items():
+            subscriptions = self._subscriptions.get(name)
+
+            if subscriptions is None:
+                continue
+
+            self._values[name] = value
+
+            for subscription in subscriptions:
+                affected[id(subscription)] = subscription
+
+        for subscription in affected.values():
+            if subscription.variables.issubset(self._values.keys()):
+                subscription.callback(
+                    {name: self._values[name] for name in subscription.variables}
+                )
+
+    def _on_variables_changed(self, _, variables: Variables):
+        self.dispatch(variables, self.clock())
@@ -1,42 +1,125 @@
 from asyncio import Event, create_task
+from dataclasses import dataclass
+from time import monotonic, perf_counter
 from traceback import print_exc
 from typing import Any
 
+from app.config import EVENT_QUEUE_SIZE
 from app.context import Context
 from app.utils.console import *
+from app.utils.types import EventQueue, Overflow
+
+
+@dataclass
+class ModuleStats:
+    """Event processing statistics of a module, used for monitoring."""
+
+    depth: int = 0
+    dropped: int = 0
+    processed: int = 0
+    last_time: float = 0.0
+    max_time: float = 0.0
+    total_time: float = 0.0
+    last_latency: float = 0.0  # time from an event arriving to its processing
+    max_latency: float = 0.0
+    total_latency: float = 0.0
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.processed if self.processed else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.processed if self.processed else 0.0
+
+    def json(self):
+        return {
+            "depth": self.depth,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "last_time": self.last_time,
+            "mean_time": self.mean_time,
+            "max_time": self.max_time,
+            "last_latency": self.last_latency,
+            "mean_latency": self.mean_latency,
+            "max_latency": self.max_latency,
+        }
 
 
 class Module:
-    """Abstract class for modules."""
+    """
+    Abstract class for modules.
+
+    Modules declare the Thymio variables they consume in `variables`, and
+    only receive changes to those. Events are pushed to a bounded queue
+    and processed in a dedicated task, so that a slow module cannot delay
+    other modules or the driver's message pump. Subclasses may override
+    `queue_size` and `overflow` to change how a backlog is handled.
+    """
+
+    variables: frozenset[str] = frozenset()
+    queue_size: int = EVENT_QUEUE_SIZE
+    overflow: Overflow = Overflow.Coalesce
 
     def __init__(self, ctx: Context):
         self.ctx = ctx
+        self.stats = ModuleStats()
 
     def __enter__(self):
-        self.ctx.node.add_variables_changed_listener(self._on_variables_changed)
+        self._queue = EventQueue(self.queue_size, self.overflow)
+        self._consumer = create_task(self._consume())
+
+        if self.variables:
+            self.ctx.events.subscribe(self.variables, self._on_variables_changed)
 
         run = getattr(self, "run", None)
         self._task = create_task(run()) if callable(run) else None
 
     def __exit__(self, *_):
-        self.ctx.node.remove_variables_changed_listener(self._on_variables_changed)
+        self.ctx.events.unsubscribe(self._on_variables_changed)
+        self._consumer.cancel()
 
         if self._task is not None:
             self._task.cancel()
 
-    def _on_variables_changed(self, _, variables):
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    def _on_variables_changed(self, variables: dict[str, Any]):
+        self._queue.put(variables, self.ctx.events.timestamp)
+        self.stats.depth = len(self._queue)
+
+    async def _consume(self):
+        """Processes queued variable events, one at a time."""
+
+        while True:
+            variables, arrived = await self._queue.get()
+            latency = monotonic() - arrived
+
+            start = perf_counter()
+            self._process(variables)
+            elapsed = perf_counter() - start
+
+            self.stats.depth = len(self._queue)
+            self.stats.dropped = self._queue.dropped
+            self.stats.processed += 1
+            self.stats.last_time = elapsed
+            self.stats.max_time = max(self.stats.max_time, elapsed)
+            self.stats.total_time += elapsed
+            self.stats.last_latency = latency
+            self.stats.max_latency = max(self.stats.max_latency, latency)
+            self.stats.total_latency += latency
+
+    def _process(self, variables: dict[str, Any]):
         try:
             self.process_event(variables)
 
-        except KeyError:
-            pass
-
         except KeyboardInterrupt:
             pass
 
         except Exception:
-            name = type(self).__name__
-            warning(f"[Module/{name}] process_event() raised an exception")
+            warning(f"[Module/{self.name}] process_event() raised an exception")
             print_exc()
 
     async def _run(self):
@@ -44,8 +127,7 @@ class Module:
             await self.run()
 
         except Exception:
-            name = type(self).__name__
-            error(f"[Module/{name}] run() raised an exception!")
+            error(f"[Module/{self.name}] run() raised an exception!")
             print_exc()
 
     async def run(self):
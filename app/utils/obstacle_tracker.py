@@ -0,0 +1,66 @@
+import numpy as np
+import numpy.typing as npt
+
+from app.config import OBSTACLE_CONFIDENCE, OBSTACLE_HISTORY, SUBDIVISIONS
+from app.utils.array_history import ArrayDelta, ArrayHistory
+
+
+class ObstacleTracker:
+    """
+    Tracks the obstacle map across noisy vision observations.
+
+    Each cell keeps a confidence counter, moving towards +`confidence` when
+    the cell is observed as an obstacle and -`confidence` when it is observed
+    as free. A cell only flips once its counter saturates on the other side,
+    so a flickering cell does not change the map. Each update returns the
+    cells that flipped with a new version number, and the recent deltas are
+    kept so that consumers can catch up from the version they last saw.
+    """
+
+    def __init__(
+        self,
+        subdivisions: int = SUBDIVISIONS,
+        confidence: int = OBSTACLE_CONFIDENCE,
+        history: int = OBSTACLE_HISTORY,
+    ):
+        self.confidence = confidence
+        self.map = np.zeros((subdivisions, subdivisions), dtype=np.int8)
+
+        self._counters = np.zeros((subdivisions, subdivisions), dtype=np.int8)
+        self._history = ArrayHistory(history)
+
+    @property
+    def version(self) -> int:
+        return self._history.version
+
+    def update(self, observation: npt.NDArray) -> ArrayDelta | None:
+        """
+        Updates the confidence counters with an observed obstacle map.
+        Returns the cells that changed, or None if the map did not change.
+        """
+
+        step = np.where(observation > 0, 1, -1).astype(np.int8)
+        limit = self.confidence
+        np.clip(self._counters + step, -limit, limit, out=self._counters)
+
+        appeared = (self._counters >= self.confidence) & (self.map == 0)
+        cleared = (self._counters <= -self.confidence) & (self.map != 0)
+        changed = appeared | cleared
+
+        if not changed.any():
+            return None
+
+        cells = np.argwhere(changed)
+        values = appeared[changed].astype(np.int8)
+        self.map[changed] = values
+
+        return self._history.push(cells, values)
+
+    def changes_since(self, version: int) -> ArrayDelta | None:
+        """
+        Returns the cells that changed since a version, merged into a single
+        delta. Returns None if the history does not go back that far, in
+        which case the whole map must be read again.
+        """
+
+        return self._history.changes_since(version)
@@ -1,32 +1,101 @@
 from asyncio import get_running_loop
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import Executor as BaseExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+from functools import partial
 from typing import Callable, ParamSpec, TypeVar
 
-from app.config import POOL_SIZE
+from app.config import POOL_SIZE, THREAD_POOL_SIZE
 
 T = TypeVar("T")
 P = ParamSpec("P")
 
+EXECUTOR_ATTRIBUTE = "__pool_executor__"
+
+
+class Executor(Enum):
+    """The kind of worker that a task should be offloaded to."""
+
+    Thread = 0  # Work that releases the GIL (OpenCV, NumPy, SciPy)
+    Process = 1  # Pure-Python work that would otherwise hold the GIL
+
+
+def task(executor: Executor):
+    """
+    Decorator that declares which kind of worker a function should run on
+    when it is passed to `Pool.run()` without an explicit executor.
+    """
+
+    def decorator(fn: Callable[P, T]) -> Callable[P, T]:
+        setattr(fn, EXECUTOR_ATTRIBUTE, executor)
+        return fn
+
+    return decorator
+
 
 class Pool:
-    """Simple process pool for offloading expensive CPU computation."""
+    """
+    Hybrid pool for offloading expensive computation. Work that releases the
+    GIL is run on a thread pool, avoiding pickling costs, while Python-heavy
+    work is run on a process pool for true parallelism.
+    """
 
     def __init__(self):
-        self.executor = None
+        self.threads = None
+        self.processes = None
 
-    def __enter__(self, size=POOL_SIZE):
-        assert self.executor is None
-        self.executor = ProcessPoolExecutor(size)
+    def __enter__(self, size=POOL_SIZE, thread_size=THREAD_POOL_SIZE):
+        assert self.threads is None and self.processes is None
+        self.threads = ThreadPoolExecutor(thread_size)
+        self.processes = ProcessPoolExecutor(size)
         return self
 
     def __exit__(self, *_):
-        assert self.executor is not None
-        self.executor.shutdown()
-        self.executor = None
+        assert self.threads is not None and self.processes is not None
+        self.threads.shutdown()
+        self.processes.shutdown()
+        self.threads = None
+        self.processes = None
 
     async def run(self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
-        """Run a function in the pool and return the result."""
+        """
+        Run a function in the pool and return the result. The worker kind is
+        taken from the `@task()` declaration, defaulting to a process.
+        """
+
+        executor = getattr(fn, EXECUTOR_ATTRIBUTE, Executor.Process)
+        return await self._submit(executor, fn, *args, **kwargs)
+
+    async def run_thread(
+        self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs
+    ) -> T:
+        """Run a function on the thread pool and return the result."""
+
+        return await self._submit(Executor.Thread, fn, *args, **kwargs)
+
+    async def run_process(
+        self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs
+    ) -> T:
+        """Run a function on the process pool and return the result."""
+
+        return await self._submit(Executor.Process, fn, *args, **kwargs)
+
+    async def _submit(self, executor: Executor, fn: Callable, *args, **kwargs):
+        """Submit a function to the chosen executor and await its result."""
 
-        assert self.executor is not None
         loop = get_running_loop()
-        return await loop.run_in_executor(self.executor, fn, *args, **kwargs)
+        return await loop.run_in_executor(
+            self._executor(executor), partial(fn, *args, **kwargs)
+        )
+
+    def _executor(self, executor: Executor) -> BaseExecutor:
+        """Returns the underlying executor for a given worker kind."""
+
+        match executor:
+            case Executor.Thread:
+                assert self.threads is not None
+                return self.threads
+
+            case Executor.Process:
+                assert self.processes is not None
+                return self.processes
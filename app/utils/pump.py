@@ -0,0 +1,169 @@
+from asyncio import Event, create_task, get_running_loop, sleep, wait_for
+from asyncio.exceptions import TimeoutError
+from collections import deque
+from time import monotonic
+from traceback import print_exc
+from typing import Any
+
+from tdmclient import ClientAsync
+
+from app.config import (
+    PROCESS_MSG_INTERVAL,
+    PUMP_LOG_INTERVAL,
+    PUMP_MAX_RESTARTS,
+    PUMP_RESTART_DELAY,
+)
+from app.utils.console import *
+
+
+class MessagePump:
+    """
+    Processes Thymio driver messages as soon as they arrive.
+
+    The tdmclient TCP transport already reads packets on its own input thread.
+    The pump hooks into that thread's packet queue to wake up the event loop
+    when a packet is received, instead of polling on a fixed interval. If the
+    transport does not expose its queue, the pump falls back to polling every
+    `PROCESS_MSG_INTERVAL` seconds.
+
+    The delay between a packet arriving and it being dispatched is measured
+    and logged periodically. The arrival time of the packet being dispatched
+    is given by `packet_time()`, so that modules can measure the latency
+    until their handler runs. Failures are reported and the pump is
+    restarted, rather than silently stopping.
+    """
+
+    def __init__(self, client: ClientAsync):
+        self.client = client
+
+        self._ready = Event()
+        self._arrivals = deque[float]()
+        self._hooked: Any = None
+        self._task = None
+        self._packet_time: float | None = None
+
+        self._latencies: list[float] = []
+        self._last_log = monotonic()
+
+    def __enter__(self):
+        self._loop = get_running_loop()
+        self._task = create_task(self._run())
+        return self
+
+    def __exit__(self, *_):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        self._unhook()
+
+    def packet_time(self) -> float:
+        """The time at which the packet being dispatched arrived."""
+
+        return self._packet_time if self._packet_time is not None else monotonic()
+
+    async def _run(self):
+        failures = 0
+
+        while True:
+            try:
+                await self._step()
+                failures = 0
+
+            except Exception:
+                failures += 1
+                error(f"\\[pump] Message pump failed ({failures}/{PUMP_MAX_RESTARTS})")
+                print_exc()
+
+                if failures >= PUMP_MAX_RESTARTS:
+                    critical("\\[pump] Giving up on the Thymio driver connection")
+                    return
+
+                self._unhook()
+                await sleep(PUMP_RESTART_DELAY)
+                info("\\[pump] Restarting message pump")
+
+    async def _step(self):
+        """Waits for incoming packets, then dispatches them."""
+
+        self._hook()
+
+        try:
+            await wait_for(self._ready.wait(), PROCESS_MSG_INTERVAL)
+        except TimeoutError:
+            pass
+
+        # Clear before processing, a packet arriving now will set it again
+        self._ready.clear()
+
+        self.client.process_waiting_messages()
+        self._packet_time = None
+        self._log(monotonic())
+
+    def _hook(self):
+        """
+        Wraps the transport's packet queue to be notified of new packets, and
+        to know when each packet that is received had arrived.
+        """
+
+        queue = getattr(self.client.tdm, "input_queue", None)
+
+        if queue is None or queue is self._hooked:
+            return
+
+        self._unhook()
+
+        put = queue.put
+        get_nowait = queue.get_nowait
+        loop = self._loop
+
+        # Packets already queued arrived at some point before now
+        self._arrivals.clear()
+        self._arrivals.extend([monotonic()] * queue.qsize())
+
+        def notify(item, *args, **kwargs):
+            self._arrivals.append(monotonic())
+            put(item, *args, **kwargs)
+
+            try:
+                loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:
+                pass  # The event loop has been closed
+
+        def receive(*args, **kwargs):
+            item = get_nowait(*args, **kwargs)
+
+            # Packets are received in the order they arrived
+            if self._arrivals:
+                self._packet_time = self._arrivals.popleft()
+                self._latencies.append(monotonic() - self._packet_time)
+
+            return item
+
+        queue.put = notify
+        queue.get_nowait = receive
+        self._hooked = queue
+        debug("\\[pump] Listening for Thymio driver packets")
+
+    def _unhook(self):
+        if self._hooked is not None:
+            del self._hooked.put
+            del self._hooked.get_nowait
+            self._hooked = None
+
+    def _log(self, now: float):
+        """Logs the dispatch delay of the packets received since the last log."""
+
+        if now - self._last_log < PUMP_LOG_INTERVAL:
+            return
+
+        if self._latencies:
+            latencies = sorted(self._latencies)
+            mean = sum(latencies) / len(latencies)
+            verbose(
+                f"\\[pump] {len(latencies)} packets, dispatch delay"
+                + f" mean {mean * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms"
+            )
+
+        self._latencies = []
+        self._last_log = now
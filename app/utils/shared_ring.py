@@ -0,0 +1,105 @@
+from multiprocessing.context import BaseContext
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+Layout = dict[str, tuple[tuple[int, ...], Any]]
+
+
+class SharedRing:
+    """
+    A fixed number of slots in shared memory, each holding a set of arrays
+    described by a layout of names to (shape, dtype). Slots are handed over
+    between processes by index: a producer acquires a free slot, writes to
+    it and passes its index on, and the consumer releases it once done. Only
+    slot indices cross process boundaries, array data is never pickled.
+
+    The ring is created by the owning process, and can be passed to child
+    processes as an argument, where it attaches to the same memory.
+    """
+
+    def __init__(self, context: BaseContext, slots: int, layout: Layout):
+        self.slots = slots
+        self.layout = layout
+
+        self._offsets, self._size = self._plan(layout)
+        self._memory = [
+            SharedMemory(create=True, size=self._size) for _ in range(slots)
+        ]
+        self._owner = True
+        self._free = context.Queue()
+
+        for slot in range(slots):
+            self._free.put(slot)
+
+        self._attach()
+
+    def __getstate__(self):
+        names = [memory.name for memory in self._memory]
+        return (self.slots, self.layout, names, self._free)
+
+    def __setstate__(self, state):
+        self.slots, self.layout, names, self._free = state
+        self._offsets, self._size = self._plan(self.layout)
+        self._memory = [SharedMemory(name=name) for name in names]
+        self._owner = False
+        self._attach()
+
+    def __getitem__(self, slot: int) -> dict[str, npt.NDArray]:
+        """Returns the arrays of a slot, as views of the shared memory."""
+
+        return self._views[slot]
+
+    def acquire(self, block=True, timeout: float | None = None) -> int | None:
+        """Takes a free slot, returning None if none is available in time."""
+
+        try:
+            return self._free.get(block, timeout)
+        except Empty:
+            return None
+
+    def release(self, slot: int):
+        """Returns a slot to the ring, once its contents have been consumed."""
+
+        self._free.put(slot)
+
+    def close(self):
+        """Detaches from the shared memory, freeing it if this is the owner."""
+
+        self._views = []
+
+        for memory in self._memory:
+            memory.close()
+
+            if self._owner:
+                memory.unlink()
+
+        self._memory = []
+
+    def _attach(self):
+        self._views = [
+            {
+                name: np.ndarray(shape, dtype, buffer=memory.buf, offset=offset)
+                for (name, (shape, dtype)), offset in zip(
+                    self.layout.items(), self._offsets
+                )
+            }
+            for memory in self._memory
+        ]
+
+    @staticmethod
+    def _plan(layout: Layout) -> tuple[list[int], int]:
+        """Returns the offset of each array in a slot, and the slot size."""
+
+        offsets = []
+        size = 0
+
+        for shape, dtype in layout.values():
+            offsets.append(size)
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            size += -(-nbytes // 64) * 64  # keep arrays cache line aligned
+
+        return offsets, max(size, 1)
@@ -0,0 +1,54 @@
+from collections import deque
+from threading import Lock
+
+import numpy as np
+
+from app.config import STAGE_TIMING_WINDOW
+
+
+class StageTimings:
+    """
+    Rolling durations of named processing stages. Durations are recorded by
+    the worker that runs the stages, and summarised from the event loop.
+    """
+
+    def __init__(self, window: int = STAGE_TIMING_WINDOW):
+        self.window = window
+
+        self._samples: dict[str, deque[float]] = {}
+        self._lock = Lock()
+
+    def record(self, stage: str, duration: float):
+        """Records the duration of a stage, in seconds."""
+
+        with self._lock:
+            samples = self._samples.get(stage)
+
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+
+            samples.append(duration)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Returns the p50, p95 and maximum duration of each stage, in seconds."""
+
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+
+        summary = {}
+
+        for stage, values in samples.items():
+            p50, p95 = np.percentile(values, (50, 95))
+            summary[stage] = {"p50": float(p50), "p95": float(p95), "max": max(values)}
+
+        return summary
+
+    def format(self) -> str:
+        """Formats the summary in milliseconds, one stage per line."""
+
+        return "\n".join(
+            f"  {stage:<24} p50 {times['p50'] * 1000:6.2f} ms"
+            + f"  p95 {times['p95'] * 1000:6.2f} ms"
+            + f"  max {times['max'] * 1000:6.2f} ms"
+            for stage, times in self.summary().items()
+        )
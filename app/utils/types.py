@@ -1,7 +1,9 @@
 from asyncio import Event, wait_for
 from asyncio.exceptions import TimeoutError
 from collections import deque
-from typing import Generic, TypeVar
+from enum import Enum
+from time import monotonic
+from typing import Any, Generic, TypeVar
 
 Coords = tuple[int, int]
 Vec2 = tuple[float, float]
@@ -56,3 +58,72 @@ class Channel(Generic[T]):
 
         except TimeoutError:
             pass
+
+    async def recv_latest(self, timeout: float | None = None) -> T | None:
+        """Receives the most recent message, discarding any older messages."""
+
+        value = await self.recv(timeout)
+
+        while len(self._messages) > 0:
+            value = self._messages.popleft()
+
+        return value
+
+
+class Overflow(Enum):
+    """The policy applied when an event is pushed to a full `EventQueue`."""
+
+    Coalesce = 0  # merge the event into the newest queued event
+    DropOldest = 1  # discard the oldest queued event
+
+
+class EventQueue:
+    """
+    A bounded queue of Thymio variable events. When the queue is full, the
+    overflow policy decides whether the new event is coalesced into the
+    latest one (keeping the newest value of each variable), or whether the
+    oldest event is discarded.
+
+    Events are stamped with the time they arrived, to measure how long they
+    waited before being processed. Coalesced events keep the earlier time.
+    """
+
+    def __init__(self, size: int, overflow: Overflow = Overflow.Coalesce):
+        assert size > 0
+        self.size = size
+        self.overflow = overflow
+        self.dropped = 0
+
+        self._signal = Signal()
+        self._events = deque[tuple[dict[str, Any], float]]()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def put(self, event: dict[str, Any], timestamp: float | None = None):
+        if timestamp is None:
+            timestamp = monotonic()
+
+        if len(self._events) >= self.size:
+            self.dropped += 1
+
+            match self.overflow:
+                case Overflow.Coalesce:
+                    # The event dictionary is shared between listeners, copy it
+                    latest, arrived = self._events[-1]
+                    self._events[-1] = ({**latest, **event}, arrived)
+                    return
+
+                case Overflow.DropOldest:
+                    self._events.popleft()
+
+        self._events.append((event, timestamp))
+        self._signal.trigger()
+
+    async def get(self) -> tuple[dict[str, Any], float]:
+        """Returns the oldest event, with the time it arrived."""
+
+        while len(self._events) == 0:
+            await self._signal.wait()
+
+        return self._events.popleft()
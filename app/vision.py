@@ -1,5 +1,10 @@
+import json
+from asyncio import create_task, sleep
 from dataclasses import dataclass
 from enum import Enum
+from pathlib import Path
+from time import monotonic, perf_counter
+from traceback import print_exc, print_exception
 from typing import Callable
 
 import cv2
@@ -8,18 +13,24 @@ import numpy as np
 import numpy.typing as npt
 from scipy.signal import convolve2d
 
+from app.calibration import AutoCalibrator, Calibration, Colour
+from app.capture import Capture, Frame
 from app.config import *
 from app.context import Context
 from app.path_finding.types import Map
+from app.state import ObstaclePolygon
 from app.utils.console import *
 from app.utils.math import clamp
-from app.utils.types import Coords, Vec2
+from app.utils.pool import Executor, task
+from app.utils.timing import StageTimings
+from app.utils.types import Channel, Coords, Vec2
+from app.vision_pipeline import Seeds, VisionPipeline
 
 # == Types == #
 
 Image = cv2.Mat
-Colour = tuple[int, int, int]
 ColourRange = tuple[Colour, Colour]
+Window = tuple[int, int, int, int]
 
 # == Constants == #
 BILATERAL_SIGMA = 75  # Denoise filter strength
@@ -31,16 +42,32 @@ THRESHOLD = 128  # Colour threshold for binarisation
 WAIT_KEY_INTERVAL_MS = 100  # GUI wait key interval
 ISOLATION_SIZE = 3  # size of isolate kernel
 ISOLATE_THRESHOLD = 3  # number of neighbours required to consider a pixel isolated
+LUT_BITS = 5  # bits per channel of the colour lookup table, at most 5
+CALIBRATION_CHECK_DIM = 32  # size of the board thumbnail used to check the calibration
+CALIBRATION_MIN_CORRELATION = 0.5  # minimum board correlation at calibration
+OBSTACLE_GATE_DIM = 32  # size of the board thumbnail compared by the obstacle gate
 
 PIXEL_MIN = 0  # Minimum pixel value
 PIXEL_MAX = 255  # Maximum pixel value
 
-# The dimensions of the image processing frame
+# The dimensions of the image processing frame, used to locate landmarks
 IMAGE_PROCESSING_DIM = PIXELS_PER_CM * TABLE_LEN
 
+# The dimensions of the downscaled frame used to segment obstacles
+OBSTACLE_PROCESSING_DIM = SUBDIVISIONS * OBSTACLE_SUPERSAMPLING
+OBSTACLE_PIXELS_PER_CM = OBSTACLE_PROCESSING_DIM / TABLE_LEN
+
 # The mean colour of an obstacle (black)
 COLOUR_OBSTACLE = (35, 35, 35)
 
+# Planes of the colour classification lookup table
+LABEL_OBSTACLE = 0
+LABEL_BACK = 1
+LABEL_FRONT = 2
+
+# The window (x0, y0, x1, y1) covering the full image processing frame
+FULL_WINDOW = (0, 0, IMAGE_PROCESSING_DIM, IMAGE_PROCESSING_DIM)
+
 
 @dataclass
 class Observation:
@@ -49,6 +76,8 @@ class Observation:
     obstacles: Map
     back: Vec2
     front: Vec2
+    timestamp: float = 0.0  # monotonic time at which the frame was captured
+    latency: float = 0.0  # time between the frame capture and the observation
 
 
 class Step(Enum):
@@ -58,6 +87,16 @@ class Step(Enum):
     Done = 3
 
 
+class Denoise(Enum):
+    """Filters that can denoise the obstacle image before segmentation."""
+
+    Bilateral = "bilateral"
+    Gaussian = "gaussian"
+    Median = "median"
+    Box = "box"  # downscale and upscale again
+    Off = "none"
+
+
 class KeyCodes(Enum):
     Q = ord("q")
     N = ord("n")
@@ -72,33 +111,98 @@ class Vision:
         external=USE_EXTERNAL_CAMERA,
         live=USE_LIVE_CAMERA,
         image_path=TEST_IMAGE_PATH,
+        tracking=USE_TRACKING,
+        denoise=DENOISE_STRATEGY,
     ):
         self.ctx = ctx
         self.external = external
         self.live = live
         self.image_path = image_path
+        self.tracking = tracking
+        self.denoise = Denoise(denoise)
 
         self.ax = None
+        self.capture = None
+        self.observations = Channel[Observation]()
+        self._last_frame = 0
+
+        # Landmark kernels only depend on the configuration, build them once
+        self._landmark_kernels = {
+            size: self._landmark_kernel(size) for size in (LM_BACK, LM_FRONT)
+        }
+
+        # Incremented each time the remap tables change
+        self.remap_version = 0
+
+        # Calibration frame shape and board thumbnail, to check the calibration
+        self._frame_shape: tuple[int, ...] = ()
+        self._reference = None
+
+        # Board corners found at calibration, and a pending unconfirmed move
+        self._calibrator = AutoCalibrator()
+        self._board_corners = None
+        self._board_moved = None
+        self._last_image = None
+
+        # Obstacle gate reference, taken when obstacles were last extracted
+        self._obstacles = None
+        self._gate_reference = None
+        self._gate_footprint = None
+        self._frames_since_refresh = 0
+        self.obstacle_frames_processed = 0
+        self.obstacle_frames_skipped = 0
+        self.pipeline_dropped = 0
+
+        # Rolling durations of each processing stage, if enabled
+        self.timings = StageTimings() if VISION_TIMINGS else None
+
+        # Consecutive tracking misses of each landmark
+        self._misses = {LM_BACK: 0, LM_FRONT: 0}
 
     def __enter__(self):
         """Initialise the vision system."""
 
-        if self.live:
-            source = 1 if self.external else 0  # 0 = webcam, 1 = external
-            self.camera = cv2.VideoCapture(source, cv2.CAP_DSHOW)
+        if self.ctx.replay is not None:
+            # Frames are fed by the session replay
+            self.capture = self.ctx.replay.frames.__enter__()
 
-            if not self.camera.isOpened():
-                raise RuntimeError("Could not open capture source!")
+        elif self.live:
+            source = 1 if self.external else 0  # 0 = webcam, 1 = external
+            self.capture = Capture(source, self.ctx.recorder).__enter__()
 
     def __exit__(self, *_):
         """Clean up the vision system."""
 
-        if self.live:
-            self.camera.release()
+        if self.capture is not None:
+            self.capture.__exit__()
+            self.capture = None
 
     # === Calibration === #
 
-    def calibrate(self):
+    def calibrate(self) -> bool:
+        """
+        Calibrates the vision system from the calibration file, if one is set
+        and exists. Otherwise calibrates automatically from the first frames,
+        falling back to the calibration GUI, and saves the result to the
+        calibration file if one is set.
+        """
+
+        path = self.ctx.calibration
+
+        if path is not None and path.exists():
+            return self._load_calibration(path)
+
+        calibrated = USE_AUTO_CALIBRATION and self._calibrate_auto()
+
+        if not calibrated and not self._calibrate_gui():
+            return False
+
+        if path is not None:
+            self._calibration().save(path)
+
+        return True
+
+    def _calibrate_gui(self) -> bool:
         """
         Runs the calibration process. This will open a GUI window and allow
         the user to select various calibration points on the image.
@@ -109,7 +213,7 @@ class Vision:
 
         image = self._read_image()
 
-        if not Image:
+        if image is None:
             raise RuntimeError("Could not read image!")
 
         info("A GUI window will open to calibrate the vision system")
@@ -146,16 +250,110 @@ class Vision:
 
         # Close the GUI window
         cv2.destroyWindow(CALIBRATE_NAMED_WINDOW)
-        self.calibration_image = None
 
-        # Generate the perspective transform
-        src = np.array(self.pts_src)
-        dst = np.array(self._homoDstPoints())
-        self.perspective_correction, _ = cv2.findHomography(src, dst)
+        # Generate the perspective transform, remap and colour lookup tables
+        self._build_remap()
+        self._build_classifier()
+
+        self._frame_shape = image.shape
+        self._reference = self._board_thumbnail(image)
+        self._track_board(image)
 
         info("Calibration complete!")
         return True
 
+    def _calibrate_auto(self) -> bool:
+        """Calibrates the vision system from the first frames, without user input."""
+
+        images = []
+
+        while len(images) < AUTO_CALIBRATION_FRAMES:
+            image = self._read_image()
+
+            if image is None:
+                break
+
+            images.append(image)
+
+        calibration = self._calibrator.calibrate(images) if images else None
+
+        if calibration is None:
+            warning("Automatic calibration failed, falling back to the calibration GUI")
+            return False
+
+        self.pts_src = calibration.corners
+        self.back_colour = calibration.back_colour
+        self.front_colour = calibration.front_colour
+
+        self._build_remap()
+        self._build_classifier()
+
+        self._frame_shape = images[-1].shape
+        self._reference = self._board_thumbnail(images[-1])
+        self._track_board(images[-1])
+
+        info(f"Automatic calibration complete, board corners {self.pts_src}")
+        return True
+
+    def _track_board(self, image: Image):
+        """Finds the board corners in a calibration frame, to detect camera moves."""
+
+        if not USE_AUTO_CALIBRATION:
+            return
+
+        self._board_corners = self._calibrator.find_corners(image)
+
+        if self._board_corners is None:
+            warning("Could not find the board, camera moves will not be detected")
+
+    @task(Executor.Thread)
+    def _check_board(self, image: Image):
+        """
+        Finds the board corners in a frame. If they moved in two consecutive
+        checks, the calibration points are shifted by the same amount and the
+        remap tables are rebuilt.
+        """
+
+        corners = self._calibrator.find_corners(image)
+
+        if corners is None or self._board_corners is None:
+            self._board_moved = None
+            return
+
+        shift = corners - self._board_corners
+
+        if np.abs(shift).max() <= CALIBRATION_MOVE_THRESHOLD:
+            self._board_moved = None
+            return
+
+        # Wait for a second check to confirm the move, something may be in the way
+        moved = self._board_moved
+        self._board_moved = corners
+
+        if moved is None or np.abs(corners - moved).max() > CALIBRATION_MOVE_THRESHOLD:
+            return
+
+        pts_src = [
+            (int(round(x + dx)), int(round(y + dy)))
+            for (x, y), (dx, dy) in zip(self.pts_src, shift)
+        ]
+
+        # Frames may be processed meanwhile, build the new tables to the side
+        homography = self._homography(pts_src)
+        remap = self._remap_tables(homography, IMAGE_PROCESSING_DIM)
+
+        # Frames only read the remap tables, which are swapped in at once
+        self._remap = remap
+        self.pts_src = pts_src
+        self.perspective_correction = homography
+        self.remap_version += 1
+
+        self._reference = self._board_thumbnail(image)
+        self._board_corners = corners
+        self._board_moved = None
+
+        warning(f"Camera moved, calibration updated to board corners {self.pts_src}")
+
     def _handle_click(self, event, x, y, image):
         """Callback for mouse clicks on the calibration GUI window."""
 
@@ -173,11 +371,11 @@ class Vision:
                             self.calibration_step = Step.Back
 
                     case Step.Back:
-                        self.back_colour = image[y, x]
+                        self.back_colour = tuple(map(int, image[y, x]))
                         self.calibration_step = Step.Front
 
                     case Step.Front:
-                        self.front_colour = image[y, x]
+                        self.front_colour = tuple(map(int, image[y, x]))
                         self.calibration_step = Step.Done
 
                     case Step.Done:
@@ -186,6 +384,249 @@ class Vision:
                     case _:
                         raise RuntimeError(f"Unexpected calibration step!")
 
+    def _load_calibration(self, path: Path) -> bool:
+        """
+        Loads a saved calibration, skipping the calibration GUI. The saved
+        tables are reused if they were built with the current settings, and
+        the calibration is checked against a new camera frame.
+        """
+
+        try:
+            calibration = Calibration.load(path)
+
+        except (OSError, ValueError, KeyError) as e:
+            error(f"Could not load calibration from {path}: {e}")
+            return False
+
+        self._apply_calibration(calibration)
+
+        image = self._read_image()
+
+        if image is None:
+            error("Could not read image!")
+            return False
+
+        self._check_calibration(image)
+        self._track_board(image)
+
+        if self._reference is None:
+            self._reference = self._board_thumbnail(image)
+
+        info(f"Calibration loaded from {path}")
+        return True
+
+    def _apply_calibration(self, calibration: Calibration):
+        """
+        Applies a calibration, reusing its tables if they were built with the
+        current settings and rebuilding them otherwise.
+        """
+
+        self.pts_src = list(calibration.corners)
+        self.back_colour = calibration.back_colour
+        self.front_colour = calibration.front_colour
+        self._frame_shape = calibration.frame_shape
+        self._reference = calibration.reference
+
+        self._build_homography()
+
+        if calibration.remap is None or calibration.lut is None:
+            self._build_remap()
+            self._build_classifier()
+
+        elif calibration.settings != self._calibration_settings():
+            warning("Calibration tables were built with different settings, rebuilding")
+            self._build_remap()
+            self._build_classifier()
+
+        else:
+            self._remap = calibration.remap
+            self._lut = calibration.lut
+            self.remap_version += 1
+
+    def _calibration(self) -> Calibration:
+        """Returns the current calibration, with its precomputed tables."""
+
+        return Calibration(
+            tuple(self._frame_shape),
+            list(self.pts_src),
+            self.back_colour,  # type: ignore
+            self.front_colour,  # type: ignore
+            self._calibration_settings(),
+            self._remap,
+            self._lut,
+            self._reference,
+        )
+
+    def _calibration_settings(self) -> dict:
+        """The settings that the calibration tables depend on."""
+
+        settings = {
+            "image_dim": IMAGE_PROCESSING_DIM,
+            "lut_bits": LUT_BITS,
+            "colour_delta": COLOUR_DELTA,
+            "colour_obstacle": COLOUR_OBSTACLE,
+            "camera_matrix": CAMERA_MATRIX,
+            "distortion_coefficients": DISTORTION_COEFFICIENTS,
+        }
+
+        # Normalise tuples to lists, as they are read back from the file
+        return json.loads(json.dumps(settings))
+
+    def _check_calibration(self, image: Image) -> bool:
+        """
+        Checks that the calibration still matches a camera frame: the frame
+        must have the same shape, and the corrected board must still look
+        like it did at calibration time.
+        """
+
+        if tuple(image.shape) != tuple(self._frame_shape):
+            warning(
+                f"Camera frame shape {image.shape} does not match"
+                + f" the calibration frame shape {tuple(self._frame_shape)}"
+            )
+            return False
+
+        if self._reference is None:
+            return True
+
+        thumbnail = self._board_thumbnail(image)
+        correlation = cv2.matchTemplate(
+            thumbnail, self._reference, cv2.TM_CCOEFF_NORMED
+        )[0, 0]
+
+        if correlation < CALIBRATION_MIN_CORRELATION:
+            warning(
+                f"Camera frame does not match the calibration"
+                + f" (correlation {correlation:.2f}), the camera may have moved"
+            )
+            return False
+
+        return True
+
+    def _board_thumbnail(self, image: Image) -> npt.NDArray[np.uint8]:
+        """Returns a small greyscale thumbnail of the corrected board."""
+
+        grey = cv2.cvtColor(self._map_image(image), cv2.COLOR_BGR2GRAY)
+        size = (CALIBRATION_CHECK_DIM, CALIBRATION_CHECK_DIM)
+        return cv2.resize(grey, size, interpolation=cv2.INTER_AREA)
+
+    def _build_homography(self):
+        """Computes the perspective transform from the calibration points."""
+
+        self.perspective_correction = self._homography(self.pts_src)
+
+    def _homography(self, pts_src: list[Coords]) -> npt.NDArray:
+        """Returns the perspective transform from a set of board corners."""
+
+        src = np.array(pts_src, dtype=np.float32)
+
+        # The homography is defined between undistorted camera pixels
+        if CAMERA_MATRIX is not None:
+            src = self._undistort_points(src)
+
+        dst = np.array(self._homoDstPoints())
+        homography, _ = cv2.findHomography(src, dst)
+        return homography
+
+    def _build_remap(self):
+        """
+        Computes the perspective transform from the calibration points, and
+        precomputes the remap tables that apply both the lens correction and
+        the perspective correction in a single `cv2.remap()` call.
+        """
+
+        self._build_homography()
+
+        self._remap = self._remap_tables(
+            self.perspective_correction, IMAGE_PROCESSING_DIM
+        )
+        self.remap_version += 1
+
+    def _remap_tables(self, homography, dim: int) -> tuple[Image, Image]:
+        """
+        Generates fixed-point remap tables that map each pixel of a square
+        output image of size `dim` back to its source pixel in the frame.
+        """
+
+        u, v = np.meshgrid(np.arange(dim), np.arange(dim))
+        points = np.dstack((u, v)).reshape(-1, 1, 2).astype(np.float32)
+
+        src = cv2.perspectiveTransform(points, np.linalg.inv(homography))
+
+        if CAMERA_MATRIX is not None:
+            src = self._distort_points(src)
+
+        src = src.reshape(dim, dim, 2)
+        return cv2.convertMaps(src[..., 0], src[..., 1], cv2.CV_16SC2)
+
+    def _undistort_points(self, points: npt.NDArray) -> npt.NDArray:
+        """Removes the lens distortion from raw camera pixel coordinates."""
+
+        matrix = np.array(CAMERA_MATRIX, dtype=np.float32)
+        coeffs = np.array(DISTORTION_COEFFICIENTS, dtype=np.float32)
+        points = points.reshape(-1, 1, 2).astype(np.float32)
+        return cv2.undistortPoints(points, matrix, coeffs, P=matrix).reshape(-1, 2)
+
+    def _distort_points(self, points: npt.NDArray) -> npt.NDArray:
+        """Applies the lens distortion to undistorted camera pixel coordinates."""
+
+        matrix = np.array(CAMERA_MATRIX, dtype=np.float32)
+        coeffs = np.array(DISTORTION_COEFFICIENTS, dtype=np.float32)
+
+        # Project normalised camera rays through the distortion model
+        rays = cv2.undistortPoints(points, matrix, None)
+        rays = cv2.convertPointsToHomogeneous(rays)
+        zero = np.zeros(3, dtype=np.float32)
+        projected, _ = cv2.projectPoints(rays, zero, zero, matrix, coeffs)
+        return projected.astype(np.float32)
+
+    def _build_classifier(self):
+        """
+        Precomputes a lookup table that labels quantised BGR colours as
+        obstacle, back landmark and front landmark. The table holds one
+        plane per label, each colour is tested against its colour range.
+        """
+
+        levels = 1 << LUT_BITS
+        shift = 8 - LUT_BITS
+
+        # The centre colour of each quantised bin, indexed by (B, G, R)
+        centres = (np.arange(levels) << shift) + ((1 << shift) >> 1)
+        b, g, r = np.meshgrid(centres, centres, centres, indexing="ij")
+        colours = np.stack((b, g, r), axis=-1).reshape(-1, 3)
+
+        planes = []
+
+        for colour in (COLOUR_OBSTACLE, self.back_colour, self.front_colour):
+            dark, light = self._colour_range(colour)
+            inside = np.all((colours >= dark) & (colours <= light), axis=1)
+            planes.append(np.where(inside, PIXEL_MAX, PIXEL_MIN).astype(np.uint8))
+
+        self._lut = np.stack(planes)
+
+    def _classify_landmarks(self, image: Image) -> tuple[Image, Image]:
+        """
+        Labels every pixel of a BGR image as back or front landmark in a
+        single table lookup. Returns the 0/255 mask of each landmark, the
+        obstacle plane is only looked up for the obstacle image.
+        """
+
+        # The landmark planes are adjacent, so the slice is a view of the table
+        planes = self._lut[LABEL_BACK : LABEL_FRONT + 1]
+        back, front = planes.take(self._lut_index(image), axis=1)
+
+        return back, front
+
+    def _lut_index(self, image: Image) -> npt.NDArray[np.uint16]:
+        """Computes the lookup table index of each pixel of a BGR image."""
+
+        # The (B, G, R) index fits in 16 bits for up to 5 bits per channel
+        quantised = (image >> (8 - LUT_BITS)).astype(np.uint16)
+        index = quantised[..., 0] << (2 * LUT_BITS)
+        index |= quantised[..., 1] << LUT_BITS
+        index |= quantised[..., 2]
+        return index
+
     def _homoDstPoints(self):
         """Returns the destination points for the perspective transform."""
 
@@ -194,27 +635,178 @@ class Vision:
 
     # === Updates === #
 
-    def next(self) -> Observation | None:
-        """Returns the next observation from the vision system."""
+    async def run(self):
+        """
+        Continuously processes frames on a worker thread, sending each
+        finished observation to the `observations` channel. The board
+        position is checked in the background, to follow camera moves.
+        """
 
-        image = self._read_image()
+        watch = None
 
-        if image is None:
+        if USE_AUTO_CALIBRATION and self.capture is not None:
+            watch = create_task(self._watch_board())
+
+        try:
+            while USE_VISION_PIPELINE and self.capture is not None:
+                await self._run_pipeline()
+
+            while True:
+                try:
+                    if self.ctx.debug_update:
+                        # Debug figures must be created from the main thread
+                        obs = self.next()
+                        self.ctx.debug_update = False
+                    else:
+                        obs = await self.ctx.pool.run(self.next, wait=True)
+
+                except Exception:
+                    error("\\[vision] Frame processing raised an exception")
+                    print_exc()
+                    obs = None
+
+                if obs is not None:
+                    obs.latency = monotonic() - obs.timestamp
+                    self.observations.send(obs)
+
+                # A fixed image never changes, there is no need to spin
+                if self.capture is None:
+                    await sleep(UPDATE_FREQUENCY)
+
+        finally:
+            if watch is not None:
+                watch.cancel()
+
+    async def _run_pipeline(self):
+        """
+        Processes frames in the multi-process pipeline, until the remap
+        tables change and the pipeline must be restarted with them.
+        """
+
+        version = self.remap_version
+
+        with VisionPipeline(self._calibration()) as pipeline:
+            feeder = create_task(self._feed_pipeline(pipeline))
+
+            try:
+                while self.remap_version == version:
+                    if not pipeline.alive:
+                        error("\\[vision] A pipeline worker stopped unexpectedly")
+                        break
+
+                    if feeder.done():
+                        error("\\[vision] Feeding frames to the pipeline failed")
+
+                        if not feeder.cancelled() and feeder.exception():
+                            print_exception(feeder.exception())
+
+                        break
+
+                    results = await self.ctx.pool.run_thread(
+                        pipeline.collect, UPDATE_FREQUENCY
+                    )
+
+                    for result in results:
+                        self._publish_result(result)
+
+                    self.pipeline_dropped = pipeline.dropped
+
+            finally:
+                feeder.cancel()
+
+        info("Restarting the vision pipeline")
+
+    async def _feed_pipeline(self, pipeline: VisionPipeline):
+        """Submits each captured frame to the pipeline."""
+
+        while True:
+            frame = await self.ctx.pool.run_thread(self._next_frame, True)
+
+            if frame is not None:
+                self._last_image = frame.image
+                pipeline.submit(frame, self._seeds())
+
+    def _seeds(self) -> Seeds:
+        """The predicted landmark positions, to track them in the pipeline."""
+
+        if not self.tracking:
+            return (None, None, None)
+
+        state = self.ctx.state
+        return (state.position, state.last_detection_front, state.position_uncertainty)
+
+    def _publish_result(self, result):
+        """Sends a pipeline result as an observation, recording its timings."""
+
+        latency = monotonic() - result.timestamp
+
+        # Obstacles are gated by the workers, count their frames here
+        self.obstacle_frames_processed += result.obstacle_frames_processed
+        self.obstacle_frames_skipped += result.obstacle_frames_skipped
+
+        if self.timings is not None:
+            self.timings.record("pipeline_rectify", result.rectify_time)
+            self.timings.record("pipeline_segment", result.segment_time)
+            self.timings.record("pipeline_latency", latency)
+
+        if result.back is None or result.front is None:
+            debug("Could not find landmarks!")
+            return
+
+        obs = Observation(result.obstacles, result.back, result.front, result.timestamp)
+        obs.latency = latency
+        self.observations.send(obs)
+
+    async def _watch_board(self):
+        """Periodically checks the board position in the latest frame."""
+
+        while True:
+            await sleep(CALIBRATION_CHECK_INTERVAL)
+
+            if self._last_image is None:
+                continue
+
+            try:
+                await self.ctx.pool.run(self._check_board, self._last_image)
+
+            except Exception:
+                error("\\[vision] Board position check raised an exception")
+                print_exc()
+
+    @task(Executor.Thread)
+    def next(self, wait=False) -> Observation | None:
+        """
+        Returns the next observation from the vision system. Unless `wait` is
+        set, returns None if no new frame has been captured since the last call.
+        """
+
+        frame = self._next_frame(wait)
+
+        if frame is None:
             return None
 
+        image = frame.image
+        self._last_image = image
+
         # If debug is set, create a new figure for other methods
         if self.ctx.debug_update:
             _, self.ax = plt.subplots(2, 3)
 
         # Apply image processing filters
+        start = perf_counter()
+
         map = self._process_image(image)
-        obstacles = self._find_obstacles(map)
-        back, front = self._find_landmarks(map)
+        back, front = self._timed("landmarks", self._find_landmarks, map)
 
         if back == None or front == None:
             debug("Could not find landmarks!")
             return None
 
+        obstacles = self._timed("obstacles", self._gated_obstacles, map, back, front)
+
+        if self.timings is not None:
+            self.timings.record("frame", perf_counter() - start)
+
         # If debug is set, show various stages of the image processing
         if self.ax is not None:
             self.ax[0][0].imshow(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
@@ -229,38 +821,70 @@ class Vision:
             obstacles,  # type: ignore
             self._to_physical_space(back),
             self._to_physical_space(front),
+            frame.timestamp,
         )
 
     def _read_image(self) -> Image | None:
-        """Reads an image from the camera or file."""
+        """Reads an image from the camera or file, waiting for a new frame."""
+
+        frame = self._next_frame(wait=True)
+        return frame.image if frame is not None else None
 
-        if self.live:
-            ret, image = self.camera.read()
-            return image if ret else None
+    def _next_frame(self, wait: bool) -> Frame | None:
+        """
+        Takes the newest captured frame, optionally waiting for one to be
+        captured, or reads the image file.
+        """
 
+        if self.capture is None:
+            image = cv2.imread(self.image_path)
+            return Frame(image, monotonic(), 0) if image is not None else None
+
+        if wait:
+            frame = self.capture.read()
         else:
-            return cv2.imread(self.image_path)  # type: ignore
+            frame = self.capture.latest(self._last_frame)
+
+        if frame is not None:
+            self._last_frame = frame.index
+
+        return frame
 
     # == Image processing == #
 
     def _process_image(self, image: Image) -> Image:
-        """Applies image processing functions to the image."""
+        """
+        Applies image processing functions to the image. The resulting map is
+        kept at full resolution for landmark localisation.
+        """
 
         return self._apply_functions(
             image,
             [
                 self._map_image,
-                self._denoise,
-                self._remove_borders,
             ],
         )
 
     def _find_obstacles(self, map: Image) -> Image:
-        """Identifies obstacles in the image."""
+        """
+        Identifies obstacles in the image. Segmentation runs on a copy that is
+        downscaled close to the size of the planning grid.
+        """
+
+        return self._segment_obstacles(self._prepare_obstacles(map))
+
+    def _prepare_obstacles(self, map: Image) -> Image:
+        """Downscales and denoises the map for obstacle segmentation."""
+
+        return self._apply_functions(map, [self._downscale, self._denoise])
+
+    def _segment_obstacles(self, image: Image) -> Image:
+        """Segments obstacles from a prepared image, into the obstacle grid."""
 
         return self._apply_functions(
-            map,
+            image,
             [
+                self._remove_borders,
                 self._isolate_obstacles,
                 self._generate_obstacle_grid,
                 self._normalise,
@@ -268,8 +892,101 @@ class Vision:
             ],
         )
 
+    def _gated_obstacles(
+        self, map: Image, back: Coords, front: Coords, prepared: Image | None = None
+    ) -> Map:
+        """
+        Identifies obstacles, unless the board has not changed outside of the
+        robot's footprint since obstacles were last identified. Obstacles are
+        identified at least every `OBSTACLE_REFRESH_FRAMES` frames. If the map
+        was already prepared for segmentation, only segmentation is run.
+        """
+
+        thumbnail = cv2.resize(
+            cv2.cvtColor(map, cv2.COLOR_BGR2GRAY),
+            (OBSTACLE_GATE_DIM, OBSTACLE_GATE_DIM),
+            interpolation=cv2.INTER_AREA,
+        )
+
+        footprint = self._robot_footprint(back, front)
+
+        if self._static_scene(thumbnail, footprint):
+            self._frames_since_refresh += 1
+            self.obstacle_frames_skipped += 1
+            return self._obstacles  # type: ignore
+
+        if prepared is None:
+            self._obstacles = self._find_obstacles(map)
+        else:
+            self._obstacles = self._segment_obstacles(prepared)
+
+        self._gate_reference = thumbnail
+        self._gate_footprint = footprint
+        self._frames_since_refresh = 0
+        self.obstacle_frames_processed += 1
+
+        return self._obstacles  # type: ignore
+
+    def _static_scene(self, thumbnail: Image, footprint: npt.NDArray[np.bool_]) -> bool:
+        """
+        Compares a board thumbnail with the one taken when obstacles were last
+        identified, ignoring the robot's footprint at both times.
+        """
+
+        if not USE_OBSTACLE_GATE or self.ax is not None:
+            return False
+
+        if self._gate_reference is None or self._gate_footprint is None:
+            return False
+
+        if self._frames_since_refresh + 1 >= OBSTACLE_REFRESH_FRAMES:
+            return False
+
+        difference = cv2.absdiff(thumbnail, self._gate_reference)
+        difference[footprint | self._gate_footprint] = 0
+
+        return difference.max() <= OBSTACLE_GATE_THRESHOLD
+
+    def _robot_footprint(self, back: Coords, front: Coords) -> npt.NDArray[np.bool_]:
+        """Returns the mask of the robot's footprint on the gate thumbnail."""
+
+        scale = OBSTACLE_GATE_DIM / IMAGE_PROCESSING_DIM
+        x = (back[0] + front[0]) / 2 * scale
+        y = (back[1] + front[1]) / 2 * scale
+        radius = OBSTACLE_GATE_ROBOT_RADIUS * PIXELS_PER_CM * scale
+
+        ys, xs = np.ogrid[:OBSTACLE_GATE_DIM, :OBSTACLE_GATE_DIM]
+        return (xs - x) ** 2 + (ys - y) ** 2 <= radius**2
+
+    def obstacle_polygons(self, obstacles: Map) -> list[ObstaclePolygon]:
+        """
+        Outlines the obstacles of an obstacle grid as simplified polygons, in
+        physical coordinates. Vertices lie on the centres of the outer cells,
+        so filling the polygons at the grid resolution covers the same cells.
+        Holes in obstacles are filled, which is conservative for planning.
+        """
+
+        mask = (obstacles != 0).astype(np.uint8)
+        contours, _ = cv2.findContours(
+            mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+
+        factor = float(PHYSICAL_SIZE_CM) / obstacles.shape[1]
+        epsilon = OBSTACLE_POLYGON_TOLERANCE / factor
+
+        return [
+            [
+                (round(float(x + 0.5) * factor, 1), round(float(y + 0.5) * factor, 1))
+                for [[x, y]] in cv2.approxPolyDP(contour, epsilon, True)
+            ]
+            for contour in contours
+        ]
+
     def _find_landmarks(self, map: Image) -> tuple[Coords | None, Coords | None]:
-        """Locates the Thymio's landmarks in the image."""
+        """
+        Locates the Thymio's landmarks in the image. When tracking, each
+        landmark is searched for around its predicted position.
+        """
 
         # Debug visualisation
         if self.ax is not None:
@@ -277,29 +994,100 @@ class Vision:
         else:
             ax = (None, None)
 
+        # Predicted positions from the EKF and the last front detection
+        if self.tracking:
+            seeds = (self.ctx.state.position, self.ctx.state.last_detection_front)
+        else:
+            seeds = (None, None)
+
+        back_window = self._search_window(seeds[0], LM_BACK)
+        front_window = self._search_window(seeds[1], LM_FRONT)
+
+        # Classify the region covering both windows in a single pass
+        region = self._bounding_window(back_window, front_window)
+        x0, y0, x1, y1 = region
+        back_mask, front_mask = self._classify_landmarks(map[y0:y1, x0:x1])
+
         # Find the landmarks
-        back = self._find_landmark(map, self.back_colour, LM_BACK, ax[0])
-        front = self._find_landmark(map, self.front_colour, LM_FRONT, ax[1])
+        back = self._find_landmark(back_mask, region, back_window, LM_BACK, ax[0])
+        front = self._find_landmark(
+            front_mask, region, front_window, LM_FRONT, ax[1]
+        )
 
         return (back, front)
 
     def _find_landmark(
         self,
-        convolution: Image,
-        colour: Colour,
+        mask: Image,
+        region: Window,
+        window: Window,
         size: float,
         axs: list[plt.Axes] | None,
     ) -> Coords | None:
-        """Finds a given landmark in the image, given a colour."""
+        """
+        Finds a given landmark within a search window, given the colour mask
+        of a region of the image that contains the window.
+        """
+
+        rx, ry, _, _ = region
+        x0, y0, x1, y1 = window
+        mask = mask[y0 - ry : y1 - ry, x0 - rx : x1 - rx]
 
-        convolution = self._isolate_landmark(convolution, colour, size, axs)
+        convolution = self._isolate_landmark(mask, size, axs)
         (x, y) = self._get_maximum(convolution)
 
         if convolution[y, x] < LANDMARK_DETECTION_THRESHOLD:
+            tracked = window != FULL_WINDOW
+            self._misses[size] = self._misses[size] + 1 if tracked else 0
             return None
 
+        self._misses[size] = 0
+
+        offset = int(0.35 * size * PIXELS_PER_CM)
+        return (x0 + x + offset, y0 + y + offset)
+
+    def _search_window(self, seed: Vec2 | None, size: float) -> Window:
+        """
+        Returns the window to search for a landmark in. This is the full
+        image, unless the landmark is being tracked, in which case the full
+        image is searched after `TRACKING_MAX_MISSES` consecutive misses.
+        """
+
+        if seed is None or self._misses[size] >= TRACKING_MAX_MISSES:
+            return FULL_WINDOW
+
+        return self._tracking_window(seed, size) or FULL_WINDOW
+
+    def _tracking_window(self, seed: Vec2, size: float) -> Window | None:
+        """
+        Returns the image window (x0, y0, x1, y1) to search for a landmark
+        predicted at the given physical position. The window grows with the
+        position uncertainty of the EKF, and includes the kernel radius.
+        """
+
+        sigma = self.ctx.state.position_uncertainty or 0.0
+        kernel_radius = self._landmark_kernels[size].shape[0] // 2
+        radius = size + TRACKING_MARGIN + TRACKING_SIGMAS * sigma
+        radius = int(radius * PIXELS_PER_CM) + kernel_radius
+
+        # Undo the detection offset to centre the window on the raw maximum
         offset = int(0.35 * size * PIXELS_PER_CM)
-        return (x + offset, y + offset)
+        x, y = self._to_image_space(seed)
+        x, y = x - offset, y - offset
+
+        x0, y0 = max(x - radius, 0), max(y - radius, 0)
+        x1 = min(x + radius + 1, IMAGE_PROCESSING_DIM)
+        y1 = min(y + radius + 1, IMAGE_PROCESSING_DIM)
+
+        if x0 >= x1 or y0 >= y1:
+            return None
+
+        return x0, y0, x1, y1
+
+    def _bounding_window(self, a: Window, b: Window) -> Window:
+        """Returns the smallest window that contains both windows."""
+
+        return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
 
     # == Image processing functions == #
 
@@ -309,23 +1097,51 @@ class Vision:
         desired image processing dimensions.
         """
 
-        return cv2.warpPerspective(
-            image,
-            self.perspective_correction,
-            (IMAGE_PROCESSING_DIM, IMAGE_PROCESSING_DIM),
-        )
+        map1, map2 = self._remap
+        return cv2.remap(image, map1, map2, cv2.INTER_LINEAR)
+
+    def _downscale(self, image: Image) -> Image:
+        """Downscales the map to the obstacle processing resolution."""
+
+        dim = OBSTACLE_PROCESSING_DIM
+        return cv2.resize(image, (dim, dim), interpolation=cv2.INTER_AREA)
 
     def _denoise(self, image: Image) -> Image:
-        """Simple denoising using a bilateral filter."""
+        """
+        Denoises the image with the configured strategy. Filters span about
+        a centimetre, the size of the smallest details worth keeping.
+        """
 
-        return cv2.bilateralFilter(
-            image, PIXELS_PER_CM, BILATERAL_SIGMA, BILATERAL_SIGMA
-        )
+        diameter = max(round(OBSTACLE_PIXELS_PER_CM), 1)
+        size = diameter | 1  # Gaussian and median kernels must be odd
+
+        match self.denoise:
+            case Denoise.Bilateral:
+                return cv2.bilateralFilter(
+                    image, diameter, BILATERAL_SIGMA, BILATERAL_SIGMA
+                )
+
+            case Denoise.Gaussian:
+                return cv2.GaussianBlur(image, (size, size), 0)
+
+            case Denoise.Median:
+                return cv2.medianBlur(image, size)
+
+            case Denoise.Box:
+                dim = image.shape[0]
+                small = max(dim // diameter, 1)
+                image = cv2.resize(
+                    image, (small, small), interpolation=cv2.INTER_AREA
+                )
+                return cv2.resize(image, (dim, dim), interpolation=cv2.INTER_LINEAR)
+
+            case Denoise.Off:
+                return image
 
     def _remove_borders(self, image: Image) -> Image:
         """Removes the border pixels from the image."""
 
-        size = PIXELS_PER_CM
+        size = max(round(OBSTACLE_PIXELS_PER_CM), 1)
         image[0:size, :] = PIXEL_MAX, PIXEL_MAX, PIXEL_MAX
         image[-size:, :] = PIXEL_MAX, PIXEL_MAX, PIXEL_MAX
         image[:, 0:size] = PIXEL_MAX, PIXEL_MAX, PIXEL_MAX
@@ -333,10 +1149,9 @@ class Vision:
         return image
 
     def _isolate_obstacles(self, image: Image) -> Image:
-        """Extracts pixels that are within the obstacle colour range."""
+        """Extracts pixels that are classified as obstacles."""
 
-        dark, light = self._colour_range(COLOUR_OBSTACLE)
-        return cv2.inRange(image, np.array(dark), np.array(light))
+        return self._lut[LABEL_OBSTACLE].take(self._lut_index(image))
 
     def _generate_obstacle_grid(self, obstacles: Image) -> Image:
         """Resizes the image to the desired final size and referential."""
@@ -370,53 +1185,37 @@ class Vision:
         return np.where(image > threshold, 1, 0)  # type: ignore
 
     def _isolate_landmark(
-        self, map: Image, colour: Colour, size: float, axs: list[plt.Axes] | None
+        self, mask: Image, size: float, axs: list[plt.Axes] | None
     ) -> Image:
-        """Attempts to isolate a landmark of a given colour and size."""
-
-        dark, light = self._colour_range(colour)
-        threshold = cv2.inRange(map, np.array(dark), np.array(light))
-
-        # 8-bit space can overflow when convolving, so we use 64-bit
-        threshold_64 = threshold.astype(np.int64)
-
-        convolution = convolve2d(
-            threshold_64,
-            self._landmark_kernel(size),
-            mode="same",
-            boundary="fill",
-            fillvalue=0,
+        """Attempts to isolate a landmark of a given size in a colour mask."""
+
+        # Float32 filtering cannot overflow and uses OpenCV's DFT path
+        convolution = cv2.filter2D(
+            mask.astype(np.float32),
+            -1,
+            self._landmark_kernels[size],
+            borderType=cv2.BORDER_CONSTANT,
         )
 
         # Debug visualisation
         if axs is not None:
-            axs[0].imshow(threshold, cmap="gray")
+            axs[0].imshow(mask, cmap="gray")
             axs[1].imshow(convolution, cmap="gray")
 
         return convolution
 
-    def _landmark_kernel(self, size: float) -> npt.NDArray[np.uint64]:
+    def _landmark_kernel(self, size: float) -> npt.NDArray[np.float32]:
         """Generates a circular kernel for the given landmark size."""
 
         disc_radius = int(size * PIXELS_PER_CM)
-        kernal_dim = 2 * disc_radius + 1
-        R2 = disc_radius**2
-
-        kernel = np.zeros((kernal_dim, kernal_dim), np.uint64)
-
-        for i in range(kernal_dim):
-            for j in range(kernal_dim):
-                if (disc_radius - i) ** 2 + (disc_radius - j) ** 2 <= R2:
-                    kernel[i, j] = 1
-
-        return kernel
+        y, x = np.ogrid[-disc_radius : disc_radius + 1, -disc_radius : disc_radius + 1]
+        return (x**2 + y**2 <= disc_radius**2).astype(np.float32)
 
     def _get_maximum(self, map: Image) -> Coords:
         """Finds the indices of the maximum value of an image."""
 
-        max = np.argmax(map, axis=None)
-        (y, x) = np.unravel_index(max, map.shape)  # type: ignore
-        return (x, y)  # type: ignore
+        _, _, _, (x, y) = cv2.minMaxLoc(map)
+        return (x, y)
 
     def _to_physical_space(self, coords: Coords) -> Vec2:
         """Converts image coordinates to physical coordinates."""
@@ -429,6 +1228,17 @@ class Vision:
         factor = float(PHYSICAL_SIZE_CM) / float(IMAGE_PROCESSING_DIM)
         return x * factor, y * factor
 
+    def _to_image_space(self, coords: Vec2) -> Coords:
+        """Converts physical coordinates to image coordinates."""
+
+        x, y = coords
+
+        factor = float(IMAGE_PROCESSING_DIM) / float(PHYSICAL_SIZE_CM)
+        x, y = int(x * factor), int(y * factor)
+
+        # Flip the y axis
+        return x, IMAGE_PROCESSING_DIM - y
+
     # == Utilities == #
 
     def _colour_range(self, colour: Colour, delta: int = COLOUR_DELTA) -> ColourRange:
@@ -440,9 +1250,32 @@ class Vision:
         return tuple(map(lambda x: clamp(x + delta, PIXEL_MIN, PIXEL_MAX), colour))
 
     def _apply_functions(self, image: Image, functions: list[Callable[[Image], Image]]):
-        """Applies a list of functions to an image in order (pipe operator)."""
+        """
+        Applies a list of functions to an image in order (pipe operator),
+        timing each of them if timings are enabled.
+        """
+
+        if self.timings is None:
+            for function in functions:
+                image = function(image)
+
+            return image
 
         for function in functions:
+            start = perf_counter()
             image = function(image)
+            self.timings.record(function.__name__.lstrip("_"), perf_counter() - start)
 
         return image
+
+    def _timed(self, stage: str, function: Callable, *args):
+        """Calls a function, timing it as a stage if timings are enabled."""
+
+        if self.timings is None:
+            return function(*args)
+
+        start = perf_counter()
+        result = function(*args)
+        self.timings.record(stage, perf_counter() - start)
+
+        return result
@@ -0,0 +1,370 @@
+import heapq
+import multiprocessing
+from dataclasses import dataclass, replace
+from queue import Empty
+from time import monotonic
+from traceback import print_exc
+
+import numpy as np
+
+from app.calibration import Calibration
+from app.capture import Frame
+from app.config import (
+    PIPELINE_RECTIFY_WORKERS,
+    PIPELINE_SEGMENT_WORKERS,
+    PIPELINE_SLOTS,
+)
+from app.context import Context
+from app.state import State
+from app.utils.console import *
+from app.utils.shared_ring import SharedRing
+from app.utils.types import Vec2
+
+PIPELINE_JOIN_TIMEOUT = 2.0  # time to wait for a worker process to stop
+PIPELINE_GAP_TIMEOUT = 1.0  # time to wait for a missing result before skipping it
+
+Seeds = tuple[Vec2 | None, Vec2 | None, float | None]
+
+
+@dataclass
+class Ticket:
+    """A frame travelling through the pipeline, referring to a ring slot."""
+
+    sequence: int
+    slot: int
+    timestamp: float  # monotonic time at which the frame was captured
+    seeds: Seeds  # predicted position, last front detection and uncertainty
+    rectify_time: float = 0.0
+
+
+@dataclass
+class Result:
+    """The outcome of a frame, sent back from the segmentation stage."""
+
+    sequence: int
+    timestamp: float
+    obstacles: np.ndarray | None
+    back: Vec2 | None
+    front: Vec2 | None
+    rectify_time: float
+    segment_time: float
+    obstacle_frames_processed: int = 0  # obstacles identified for this frame
+    obstacle_frames_skipped: int = 0  # obstacles reused from an earlier frame
+
+
+class VisionPipeline:
+    """
+    Processes frames in separate processes, in stages connected by rings of
+    shared memory buffers:
+
+    1. capture: the owner copies each frame into a free frame slot
+    2. rectify: workers correct the perspective and denoise the obstacle
+       image, writing both into a free map slot
+    3. segment: workers locate the landmarks and segment the obstacles
+
+    Each stage can run several workers, so throughput scales with cores.
+    Frames carry a sequence number, results are returned in capture order.
+    When all frame slots are in use, new frames are dropped. A result that
+    never arrives is skipped after `PIPELINE_GAP_TIMEOUT`, or as soon as
+    more results are held back than there are frames in flight.
+    """
+
+    def __init__(
+        self,
+        calibration: Calibration,
+        rectify_workers: int = PIPELINE_RECTIFY_WORKERS,
+        segment_workers: int = PIPELINE_SEGMENT_WORKERS,
+        slots: int = PIPELINE_SLOTS,
+    ):
+        self.calibration = calibration
+        self.rectify_workers = rectify_workers
+        self.segment_workers = segment_workers
+        self.slots = slots
+
+        self.submitted = 0
+        self.dropped = 0
+        self.skipped = 0
+
+        self._next_sequence = 1
+        self._pending: list[tuple[int, Result]] = []
+        self._gap_since: float | None = None  # time the next result was missed
+        self._processes = []
+
+    def __enter__(self):
+        # Spawn for the same behaviour on every platform
+        context = multiprocessing.get_context("spawn")
+
+        # The vision module depends on the pipeline, import it lazily
+        from app.vision import IMAGE_PROCESSING_DIM, OBSTACLE_PROCESSING_DIM
+
+        map_dim = IMAGE_PROCESSING_DIM
+        obstacle_dim = OBSTACLE_PROCESSING_DIM
+
+        self.frames = SharedRing(
+            context,
+            self.slots,
+            {"image": (tuple(self.calibration.frame_shape), np.uint8)},
+        )
+        self.maps = SharedRing(
+            context,
+            self.slots,
+            {
+                "map": ((map_dim, map_dim, 3), np.uint8),
+                "obstacles": ((obstacle_dim, obstacle_dim, 3), np.uint8),
+            },
+        )
+
+        self._rectify_queue = context.Queue()
+        self._segment_queue = context.Queue()
+        self._results = context.Queue()
+
+        for i in range(self.rectify_workers):
+            self._start(
+                context,
+                f"Rectify-{i}",
+                _rectify_worker,
+                self._rectify_queue,
+                self._segment_queue,
+            )
+
+        for i in range(self.segment_workers):
+            self._start(
+                context,
+                f"Segment-{i}",
+                _segment_worker,
+                self._segment_queue,
+                self._results,
+            )
+
+        info(
+            f"Vision pipeline started with {self.rectify_workers} rectify"
+            + f" and {self.segment_workers} segment workers"
+        )
+
+        return self
+
+    def __exit__(self, *_):
+        for _ in range(self.rectify_workers):
+            self._rectify_queue.put(None)
+
+        for _ in range(self.segment_workers):
+            self._segment_queue.put(None)
+
+        for process in self._processes:
+            process.join(PIPELINE_JOIN_TIMEOUT)
+
+            if process.is_alive():
+                process.terminate()
+
+        self._processes = []
+        self.frames.close()
+        self.maps.close()
+
+    def submit(self, frame: Frame, seeds: Seeds) -> bool:
+        """
+        Copies a frame into the pipeline. Returns False if the frame was
+        dropped because all frame slots are in use, or because it does not
+        have the shape of the calibration frames.
+        """
+
+        if tuple(frame.image.shape) != tuple(self.calibration.frame_shape):
+            warning(f"\\[pipeline] Dropping frame of shape {frame.image.shape}")
+            self.dropped += 1
+            return False
+
+        slot = self.frames.acquire(block=False)
+
+        if slot is None:
+            self.dropped += 1
+            return False
+
+        try:
+            self.frames[slot]["image"][:] = frame.image
+
+        except Exception:
+            self.frames.release(slot)
+            raise
+
+        self.submitted += 1
+
+        ticket = Ticket(self.submitted, slot, frame.timestamp, seeds)
+        self._rectify_queue.put(ticket)
+
+        return True
+
+    @property
+    def alive(self) -> bool:
+        """Whether all worker processes are still running."""
+
+        return all(process.is_alive() for process in self._processes)
+
+    def collect(self, timeout: float) -> list[Result]:
+        """
+        Waits for results, returning those that are next in capture order.
+        Results that arrive early are held back until their turn.
+        """
+
+        try:
+            result = self._results.get(timeout=timeout)
+
+            while True:
+                heapq.heappush(self._pending, (result.sequence, result))
+                result = self._results.get_nowait()
+
+        except Empty:
+            pass
+
+        ordered = []
+
+        while self._pending:
+            sequence, result = self._pending[0]
+
+            if sequence != self._next_sequence:
+                if not self._skip_gap(sequence):
+                    break
+
+                continue
+
+            heapq.heappop(self._pending)
+            ordered.append(result)
+            self._next_sequence += 1
+            self._gap_since = None
+
+        return ordered
+
+    def _skip_gap(self, sequence: int) -> bool:
+        """
+        Whether to give up on the results missing before a sequence number,
+        as they may have been lost with a worker. Frames and maps each have
+        `slots` buffers, more results can not be in flight.
+        """
+
+        now = monotonic()
+
+        if self._gap_since is None:
+            self._gap_since = now
+
+        if (
+            now - self._gap_since < PIPELINE_GAP_TIMEOUT
+            and len(self._pending) <= 2 * self.slots
+        ):
+            return False
+
+        warning(
+            f"\\[pipeline] Skipping lost frames {self._next_sequence}"
+            + f" to {sequence - 1}"
+        )
+
+        self.skipped += sequence - self._next_sequence
+        self._next_sequence = sequence
+        self._gap_since = None
+
+        return True
+
+    def _start(self, context, name: str, target, *args):
+        process = context.Process(
+            target=target,
+            name=name,
+            args=(self.calibration, self.frames, self.maps, *args),
+            daemon=True,
+        )
+
+        process.start()
+        self._processes.append(process)
+
+
+def _worker_vision(calibration: Calibration):
+    """Creates a vision system in a worker process, from the calibration."""
+
+    from app.vision import Vision
+
+    vision = Vision(Context(None, None, None, State()), live=False)  # type: ignore
+    vision.timings = None
+    vision._apply_calibration(calibration)
+
+    return vision
+
+
+def _rectify_worker(
+    calibration: Calibration, frames: SharedRing, maps: SharedRing, inbox, outbox
+):
+    """Corrects the perspective of frames and prepares obstacle segmentation."""
+
+    vision = _worker_vision(calibration)
+
+    while (ticket := inbox.get()) is not None:
+        start = monotonic()
+        slot = maps.acquire()
+        buffers = maps[slot]
+
+        try:
+            map = vision._process_image(frames[ticket.slot]["image"])
+            buffers["map"][:] = map
+            buffers["obstacles"][:] = vision._prepare_obstacles(map)
+
+        except Exception:
+            error(f"\\[pipeline] Rectification of frame {ticket.sequence} failed")
+            print_exc()
+
+        frames.release(ticket.slot)
+        outbox.put(replace(ticket, slot=slot, rectify_time=monotonic() - start))
+
+    frames.close()
+    maps.close()
+
+
+def _segment_worker(
+    calibration: Calibration, frames: SharedRing, maps: SharedRing, inbox, outbox
+):
+    """Locates the landmarks and segments the obstacles of rectified frames."""
+
+    vision = _worker_vision(calibration)
+    state = vision.ctx.state
+
+    while (ticket := inbox.get()) is not None:
+        start = monotonic()
+        buffers = maps[ticket.slot]
+        obstacles = back = front = None
+
+        # Track the landmarks around the position predicted by the owner
+        state.position, state.last_detection_front, state.position_uncertainty = (
+            ticket.seeds
+        )
+
+        processed = vision.obstacle_frames_processed
+        skipped = vision.obstacle_frames_skipped
+
+        try:
+            back, front = vision._find_landmarks(buffers["map"])
+
+            if back is not None and front is not None:
+                obstacles = vision._gated_obstacles(
+                    buffers["map"], back, front, buffers["obstacles"]
+                ).copy()
+
+                back = vision._to_physical_space(back)
+                front = vision._to_physical_space(front)
+
+        except Exception:
+            error(f"\\[pipeline] Segmentation of frame {ticket.sequence} failed")
+            print_exc()
+            obstacles = back = front = None
+
+        maps.release(ticket.slot)
+
+        outbox.put(
+            Result(
+                ticket.sequence,
+                ticket.timestamp,
+                obstacles,
+                back,
+                front,
+                ticket.rectify_time,
+                monotonic() - start,
+                vision.obstacle_frames_processed - processed,
+                vision.obstacle_frames_skipped - skipped,
+            )
+        )
+
+    frames.close()
+    maps.close()
@@ -0,0 +1,65 @@
+from asyncio import run
+
+import numpy as np
+
+from app.config import SUBDIVISIONS
+from app.context import Context
+from app.global_navigation import GlobalNavigation
+from app.state import State
+from report.map import reset
+from report.mock_pool import MockPool
+
+
+def create_navigation() -> GlobalNavigation:
+    ctx = Context(None, None, MockPool(), State())  # type: ignore
+    reset(ctx)
+
+    ctx.state.position = (25, 18)
+    ctx.state.end = (53, 55)
+
+    return GlobalNavigation(ctx)
+
+
+def test_obstacles_set_on_state():
+    """Obstacles written to the state, as in the report, reach the boundary map."""
+
+    navigation = create_navigation()
+    state = navigation.ctx.state
+
+    state.obstacles[30:45, 40:55] = 1
+    run(navigation._recompute_path())
+
+    assert state.boundary_map is not None
+    assert state.boundary_map[state.obstacles != 0].all()
+    assert state.boundary_map.sum() > state.obstacles.sum()
+
+    # Changing the same array in place is picked up by the next computation
+    state.obstacles[:, :] = 0
+    state.obstacles[20:30, 5:20] = 1
+    run(navigation._recompute_path())
+
+    assert state.boundary_map[25, 10] == 1
+    assert state.boundary_map[37, 47] == 0
+
+
+def test_obstacles_from_tracker():
+    """The tracker's map is kept up to date with its changes."""
+
+    navigation = create_navigation()
+    ctx = navigation.ctx
+    ctx.state.obstacles = ctx.obstacles.map
+
+    observation = np.zeros((SUBDIVISIONS, SUBDIVISIONS), dtype=np.int8)
+    observation[30:45, 40:55] = 1
+
+    for _ in range(ctx.obstacles.confidence):
+        ctx.obstacles.update(observation)
+
+    run(navigation._recompute_path())
+    assert ctx.state.boundary_map[37, 47] == 1
+
+    for _ in range(2 * ctx.obstacles.confidence):
+        ctx.obstacles.update(np.zeros_like(observation))
+
+    run(navigation._recompute_path())
+    assert ctx.state.boundary_map.sum() == 0
@@ -10,8 +10,16 @@ import {
 
 const HISTORY = 16;
 const SERVER_URL = "ws://localhost:8080/ws";
+const PROTOCOLS = ["binary.v1", "json"]; // preferred first
 
-export const FILTERED_KEYS = ["path", "obstacles", "boundary_map", "nodes"];
+export const FILTERED_KEYS = [
+    "path",
+    "obstacles",
+    "obstacle_changes",
+    "obstacle_polygons",
+    "boundary_map",
+    "nodes",
+];
 
 /* == Types == */
 
@@ -19,6 +27,40 @@ export type Tuple2<T = number> = [T, T];
 export type ExtraObstacle = Tuple2<Tuple2>;
 export type Map = number[][];
 
+export interface ArrayChanges {
+    version: number;
+    cells: [number, number, number][]; // row, column, value
+}
+
+// Map fields that patches may update with only their changed cells, must
+// match `ARRAY_KEYS` in app/state.py
+const ARRAY_KEYS = ["obstacles", "boundary_map"] as const;
+
+export interface Message {
+    type: string;
+    data: any;
+}
+
+interface ArrayHeader {
+    key: string;
+    dtype: keyof typeof TYPED_ARRAYS;
+    shape: number[];
+    bits: boolean; // packed to one bit per value
+    offset: number;
+    length: number;
+}
+
+const TYPED_ARRAYS = {
+    int8: Int8Array,
+    uint8: Uint8Array,
+    int16: Int16Array,
+    uint16: Uint16Array,
+    int32: Int32Array,
+    uint32: Uint32Array,
+    float32: Float32Array,
+    float64: Float64Array,
+};
+
 export interface State {
     position: Tuple2 | null;
     orientation: number | null;
@@ -28,6 +70,10 @@ export interface State {
     path: Tuple2[] | null;
     next_waypoint_index: number | null;
     obstacles: Map;
+    obstacle_changes: ArrayChanges | null;
+    obstacles_version: number;
+    obstacle_polygons: Tuple2[][];
+    obstacle_polygons_version: number;
     extra_obstacles: ExtraObstacle[];
     boundary_map: Map | null;
     computation_time: number | null;
@@ -76,6 +122,76 @@ export function send(type: string, data: unknown) {
     tx.dispatchEvent(new CustomEvent("message", { detail: { type, data } }));
 }
 
+/**
+ * Applies changed cells to a copy of a map. Changes hold absolute cell
+ * values, applying them more than once is harmless.
+ */
+function applyChanges(map: Map, changes: ArrayChanges): Map {
+    const copy = map.map((row) => row.slice());
+
+    for (const [row, column, value] of changes.cells) {
+        copy[row][column] = value;
+    }
+
+    return copy;
+}
+
+/**
+ * Decodes a message from the server, sent either as JSON text or as a binary
+ * frame: a uint32 header length, a JSON header and the raw arrays that it
+ * describes. Arrays are converted back to nested lists.
+ */
+function decodeMessage(data: string | ArrayBuffer): Message {
+    if (typeof data === "string") {
+        return JSON.parse(data);
+    }
+
+    const length = new DataView(data).getUint32(0, true);
+    const header = JSON.parse(
+        new TextDecoder().decode(new Uint8Array(data, 4, length))
+    );
+
+    for (const array of header.arrays as ArrayHeader[]) {
+        const offset = 4 + length + array.offset;
+        const size = array.shape.reduce((a, b) => a * b, 1);
+
+        const values = array.bits
+            ? unpackBits(new Uint8Array(data, offset, array.length), size)
+            : new TYPED_ARRAYS[array.dtype](
+                  data,
+                  offset,
+                  array.length / TYPED_ARRAYS[array.dtype].BYTES_PER_ELEMENT
+              );
+
+        header.data[array.key] = reshape(Array.from(values), array.shape);
+    }
+
+    return { type: header.type, data: header.data };
+}
+
+/** Unpacks bits, most significant bit first, as NumPy's `packbits`. */
+function unpackBits(bytes: Uint8Array, size: number): Uint8Array {
+    const values = new Uint8Array(size);
+
+    for (let i = 0; i < size; i++) {
+        values[i] = (bytes[i >> 3] >> (7 - (i & 7))) & 1;
+    }
+
+    return values;
+}
+
+/** Splits a flat row-major array into nested lists of the given shape. */
+function reshape(values: number[], shape: number[]): any {
+    if (shape.length <= 1) return values;
+
+    const [rows, ...rest] = shape;
+    const stride = values.length / rows;
+
+    return Array.from({ length: rows }, (_, i) =>
+        reshape(values.slice(i * stride, (i + 1) * stride), rest)
+    );
+}
+
 /* == Stores == */
 
 export const socketUrl = writable(SERVER_URL);
@@ -88,7 +204,8 @@ const socket = derived<Writable<number | boolean>, WebSocket | null>(
             return;
         }
 
-        const ws = new WebSocket(get(socketUrl));
+        const ws = new WebSocket(get(socketUrl), PROTOCOLS);
+        ws.binaryType = "arraybuffer";
 
         const txHandler = (e: Event) => {
             if (e instanceof CustomEvent && ws?.readyState === WebSocket.OPEN) {
@@ -153,15 +270,14 @@ export const connectionStatus = derived(
 
 export const events = derived<
     Readable<WebSocket | null>,
-    { type: string; data: unknown } | null
+    Message | null
 >(
     socket,
     (ws, set) => {
         if (!ws) return;
 
         const handler = (e: MessageEvent) => {
-            const payload = JSON.parse(e.data);
-            set(payload);
+            set(decodeMessage(e.data));
         };
 
         ws.addEventListener("message", handler);
@@ -182,7 +298,7 @@ export const server = derived(
         let state: State | null = null;
 
         const handler = (e: MessageEvent) => {
-            const { type, data } = JSON.parse(e.data);
+            const { type, data } = decodeMessage(e.data);
 
             switch (type) {
                 case "msg":
@@ -199,9 +315,29 @@ export const server = derived(
                         return;
                     }
 
+                    const patch = data as Partial<State>;
+
+                    // The obstacle map is patched cell by cell
+                    if (patch.obstacle_changes && !patch.obstacles) {
+                        patch.obstacles = applyChanges(
+                            state.obstacles,
+                            patch.obstacle_changes
+                        );
+                    }
+
+                    // Map fields may only carry their changed cells
+                    for (const key of ARRAY_KEYS) {
+                        const value: unknown = patch[key];
+                        const map = state[key];
+
+                        if (value && !Array.isArray(value) && map) {
+                            patch[key] = applyChanges(map, value as ArrayChanges);
+                        }
+                    }
+
                     state = {
                         ...state,
-                        ...(data as Partial<State>),
+                        ...patch,
                     };
 
                     break;